@@ -0,0 +1,321 @@
+"""AniList cog benchmark against the local GraphQL stand-in.
+
+Drives `send_info`, `anime search` page flipping, `getwatchlist` and the
+schedule refresh with its announcement fan-out at scale, against
+`benchmarks.anilist_server` instead of AniList. Reports requests issued,
+p50/p99 latency and memory of each step. Run from the repository root:
+
+    python3 -m benchmarks.anilist [media] [guilds] [latency ms] [error rate]
+
+`BENCH_RATE=90` keeps AniList's real request budget (unthrottled by
+default). `BENCH_JSON=results.json` saves the results and
+`BENCH_BASELINE=results.json` compares against saved ones, exiting with 1
+when requests or p99 latency got worse by more than `BENCH_TOLERANCE`
+(0.2 = 20%).
+"""
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.anilist_server import WORDS, StandIn, make_catalog
+from types import SimpleNamespace
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+class Step:
+    """Latencies, requests and memory of one benchmark step."""
+
+    def __init__(self, name, server):
+        self.name = name
+        self.server = server
+        self.latencies = []
+        self.failed = 0
+
+    def __enter__(self):
+        self.requests = sum(self.server.requests.values())
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.requests = sum(self.server.requests.values()) - self.requests
+        self.peak = tracemalloc.get_traced_memory()[1] - self.memory
+
+    async def time(self, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        except Exception:
+            self.failed += 1
+        self.latencies.append(time.perf_counter() - start)
+
+    def result(self):
+        return {
+            "ops": len(self.latencies),
+            "failed": self.failed,
+            "requests": self.requests,
+            "p50": percentile(self.latencies, 0.5),
+            "p99": percentile(self.latencies, 0.99),
+            "seconds": self.elapsed,
+            "peak": self.peak,
+        }
+
+
+class Typing:
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class Message:
+    def __init__(self, user):
+        self.user = user
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def remove_reaction(self, emoji, user):
+        pass
+
+    async def edit(self, embed=None):
+        # Time from the reaction until the page changed
+        self.user.flips.append(time.perf_counter() - self.user.reacted)
+
+
+class Channel:
+    def __init__(self, channel_id, latency):
+        self.id = channel_id
+        self.guild = channel_id
+        self.latency = latency
+
+    async def send(self, content=None, embed=None):
+        await asyncio.sleep(self.latency)
+
+
+def make_ctx(guild_id, script=()):
+    user = SimpleNamespace(id=guild_id, script=list(script), reacted=0.0, flips=[])
+
+    async def send(content=None, embed=None):
+        return Message(user)
+
+    return SimpleNamespace(
+        prefix=">",
+        guild=SimpleNamespace(id=guild_id),
+        author=user,
+        channel=SimpleNamespace(is_nsfw=lambda: False),
+        send=send,
+        typing=Typing,
+    )
+
+
+def make_wait_for(users):
+    """Stands in for `bot.wait_for("reaction_add")`, plays each user's script."""
+
+    async def wait_for(event, check=None, timeout=None):
+        await asyncio.sleep(0)
+        for user in users:
+            if user.script and check(SimpleNamespace(emoji=user.script[0]), user):
+                user.reacted = time.perf_counter()
+                return SimpleNamespace(emoji=user.script.pop(0)), user
+        raise asyncio.TimeoutError
+
+    return wait_for
+
+
+async def gather(step, coros, concurrency=25):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(coro):
+        async with semaphore:
+            await step.time(coro)
+
+    await asyncio.gather(*[run(c) for c in coros])
+
+
+def lookups(catalog, amount, rng):
+    """Info lookups by id, name and MyAnimeList link, popular shows repeat."""
+    media = list(catalog.values())
+    weights = [1 / (rank + 1) for rank in range(len(media))]
+    picked = []
+    for m in rng.choices(media, weights, k=amount):
+        kind = rng.random()
+        if kind < 0.5:
+            picked.append(str(m["id"]))
+        elif kind < 0.8 or not m["idMal"]:
+            picked.append(m["title"]["romaji"])
+        else:
+            picked.append(f"https://myanimelist.net/anime/{m['idMal']}")
+    return picked
+
+
+async def main(amount=2000, guilds=300, latency=50, error_rate=0.0):
+    rng = random.Random(2264)
+    tracemalloc.start()
+    os.chdir(tempfile.mkdtemp())
+    catalog = make_catalog(amount)
+    server = StandIn(
+        catalog, latency=latency / 1000, jitter=latency / 2500, error_rate=error_rate
+    )
+    os.environ["ANILIST_URL"] = await server.start()
+
+    from bot import ziBot, get_prefix
+    from cogs import anilist
+    from utilities.ratelimit import RateGovernor
+
+    bot = ziBot(command_prefix=get_prefix)
+    bot.load_extension("cogs.anilist")
+    cog = bot.get_cog("AniList")
+    cog.governor = RateGovernor(int(os.getenv("BENCH_RATE") or 100000), 60)
+    steps = []
+
+    # Every guild watches a few shows, mostly ones that are still airing
+    airing = [m["id"] for m in catalog.values() if m["nextAiringEpisode"]]
+    ids = list(catalog)
+    cog.watchlists = {
+        str(g): rng.sample(airing, rng.randint(3, 25)) + rng.sample(ids, 3)
+        for g in range(1, guilds + 1)
+    }
+    for name in ["watchlist (cold)", "watchlist (warm)"]:
+        with Step(name, server) as step:
+            ctxs = [make_ctx(int(g)) for g in cog.watchlists]
+            await gather(step, [anilist.getwatchlist(cog, c) for c in ctxs], guilds)
+        steps.append(step)
+
+    work = lookups(catalog, min(amount, 1000), rng)
+    for name in ["info (cold)", "info (warm)"]:
+        with Step(name, server) as step:
+            await gather(step, [anilist.send_info(cog, make_ctx(1), a) for a in work])
+        steps.append(step)
+
+    # Flip through 25 pages of 20 concurrent searches
+    ctxs = [make_ctx(i, ["▶️"] * 24 + ["⏹️"]) for i in range(20)]
+    bot.wait_for = make_wait_for([c.author for c in ctxs])
+    with Step("search", server) as step:
+        await gather(
+            step,
+            [cog.search.callback(cog, c, rng.choice(WORDS)) for c in ctxs],
+            len(ctxs),
+        )
+    for c in ctxs:
+        step.latencies.extend(c.author.flips)
+    steps.append(step)
+
+    with Step("schedule", server) as step:
+        await step.time(anilist.getschedule(cog, int(time.time() + 25 * 60 * 60)))
+    steps.append(step)
+
+    # Every guild announces in its own channel
+    for g in cog.watchlists:
+        bot.config.setdefault(g, {})["anime_ch"] = int(g)
+    bot.get_channel = lambda i: Channel(i, latency / 1000) if i else None
+    with Step("announce", server) as step:
+        for due, key, release in cog.scheduler.pending():
+            await step.time(anilist.announce(cog, key, release))
+    steps.append(step)
+
+    results = {
+        "params": {
+            "media": amount,
+            "guilds": guilds,
+            "latency": latency,
+            "error_rate": error_rate,
+        },
+        "steps": {step.name: step.result() for step in steps},
+        "requests": dict((str(k), v) for k, v in server.requests.items()),
+        "media_cache": cog.media_cache.size,
+        # Kilobytes on Linux
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+    report(results)
+
+    bot.remove_cog("AniList")
+    await bot.session.close()
+    await server.stop()
+    return results
+
+
+def report(results):
+    print(
+        f"{'step':<18} {'ops':>6} {'failed':>6} {'requests':>8}"
+        + f" {'p50 ms':>8} {'p99 ms':>8} {'peak MiB':>9}"
+    )
+    for name, r in results["steps"].items():
+        print(
+            f"{name:<18} {r['ops']:>6} {r['failed']:>6} {r['requests']:>8}"
+            + f" {r['p50'] * 1000:>8.1f} {r['p99'] * 1000:>8.1f}"
+            + f" {r['peak'] / 2 ** 20:>9.2f}"
+        )
+    print(
+        "Requests by query: "
+        + ", ".join(f"{k}: {v}" for k, v in sorted(results["requests"].items()))
+    )
+    print(
+        f"Media cache {results['media_cache'] / 2 ** 20:.2f} MiB,"
+        + f" max RSS {results['max_rss'] / 2 ** 20:.1f} MiB"
+    )
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Regressions of `results` against `baseline`, as readable lines."""
+    regressions = []
+    for name, r in results["steps"].items():
+        base = baseline["steps"].get(name)
+        if base is None:
+            continue
+        if r["requests"] > base["requests"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {r['requests']} requests, was {base['requests']}"
+            )
+        # A millisecond of slack so tiny steps don't flap
+        if r["p99"] > base["p99"] * (1 + tolerance) + 0.001:
+            regressions.append(
+                f"{name}: p99 {r['p99'] * 1000:.1f}ms, was {base['p99'] * 1000:.1f}ms"
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    baseline = os.getenv("BENCH_BASELINE")
+    output = os.getenv("BENCH_JSON")
+    if baseline:
+        with open(baseline, "r") as f:
+            baseline = json.load(f)
+    if output:
+        output = os.path.abspath(output)
+
+    results = asyncio.run(
+        main(
+            int(args[0]) if args else 2000,
+            int(args[1]) if len(args) > 1 else 300,
+            float(args[2]) if len(args) > 2 else 50,
+            float(args[3]) if len(args) > 3 else 0.0,
+        )
+    )
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+    if baseline:
+        regressions = compare(
+            results, baseline, float(os.getenv("BENCH_TOLERANCE") or 0.2)
+        )
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
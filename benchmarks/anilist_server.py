@@ -0,0 +1,361 @@
+"""Local stand-in for AniList's GraphQL API.
+
+Answers the queries the AniList cog sends (`scheduleQuery`, `searchAni`,
+`listQ`, `airingQuery`, name and MyAnimeList lookups) from a generated
+catalog, with configurable latency and injected errors. Responses found in
+a recordings file are replayed as they were recorded. Point the bot at it
+with `ANILIST_URL=http://127.0.0.1:8080`:
+
+    python3 -m benchmarks.anilist_server [port] [media] [latency ms] [error rate] [recordings.json]
+
+With `ANILIST_UPSTREAM=https://graphql.anilist.co` set, queries missing from
+the recordings are forwarded there and saved to the recordings file on exit.
+"""
+import aiohttp
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from aiohttp import web
+from collections import Counter
+
+WORDS = [
+    "silent",
+    "garden",
+    "sword",
+    "academy",
+    "summer",
+    "dragon",
+    "ghost",
+    "idol",
+    "railgun",
+    "witch",
+    "island",
+    "cafe",
+    "galaxy",
+    "maid",
+    "titan",
+    "tale",
+]
+FORMATS = ["TV", "TV", "TV", "TV_SHORT", "MOVIE", "OVA", "ONA", "SPECIAL"]
+GENRES = ["Action", "Comedy", "Drama", "Fantasy", "Romance", "Sci-Fi", "Slice of Life"]
+SITES = ["Crunchyroll", "Funimation", "Netflix", "Hidive", "Official Site", "Twitter"]
+
+
+def make_catalog(amount=2000, seed=2264, now=None):
+    """{media id: Media} shaped like AniList's, about a third still airing."""
+    rng = random.Random(seed)
+    now = int(now or time.time())
+    catalog = {}
+    for i in range(amount):
+        media_id = 1000 + i
+        title = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}"
+        airing = rng.random() < 0.35
+        episodes = rng.choice([1, 12, 13, 24, 25, None])
+        catalog[media_id] = {
+            "id": media_id,
+            "format": rng.choice(FORMATS),
+            "title": {
+                "romaji": title,
+                "english": title.upper() if rng.random() < 0.5 else None,
+            },
+            "siteUrl": f"https://anilist.co/anime/{media_id}",
+            "idMal": 50000 + i if rng.random() < 0.9 else None,
+            "synonyms": [f"{title} ({rng.randint(1990, 2021)})"],
+            "episodes": episodes,
+            "duration": rng.choice([3, 24, 25, 110]),
+            "status": "RELEASING" if airing else "FINISHED",
+            "startDate": {"year": rng.randint(1990, 2021), "month": 4, "day": 1},
+            "endDate": {"year": None, "month": None, "day": None},
+            "genres": rng.sample(GENRES, 3),
+            "coverImage": {
+                "large": f"https://example.com/cover/{media_id}.jpg",
+                "color": "#02a9ff",
+            },
+            "bannerImage": None,
+            "description": "<i>Generated</i> for benchmarks.<br>" * 8,
+            "averageScore": rng.randint(30, 95),
+            "studios": {"nodes": [{"name": f"Studio {rng.choice(WORDS).title()}"}]},
+            "seasonYear": rng.randint(1990, 2021),
+            "externalLinks": [
+                {"site": site, "url": f"https://example.com/{site}/{media_id}"}
+                for site in rng.sample(SITES, 3)
+            ],
+            "nextAiringEpisode": {
+                "episode": rng.randint(2, 24),
+                "airingAt": now + rng.randint(60, 7 * 24 * 60 * 60),
+                "timeUntilAiring": 0,
+            }
+            if airing
+            else None,
+        }
+    return catalog
+
+
+def classify(query):
+    """Name of the cog query `query` is, None if it isn't one."""
+    if "airingSchedules(" in query:
+        return "schedule"
+    if "AiringSchedule(" in query:
+        return "airing"
+    if "media(id_in" in query:
+        return "list"
+    if "media(search" in query:
+        return "search"
+    if "Media(idMal" in query:
+        return "mal"
+    if "Media(search" in query:
+        return "name"
+    return None
+
+
+def page(items, number, per_page):
+    number = max(number or 1, 1)
+    start = (number - 1) * per_page
+    last = max((len(items) + per_page - 1) // per_page, 1)
+    info = {
+        "currentPage": number,
+        "hasNextPage": number < last,
+        "lastPage": last,
+        "total": len(items),
+    }
+    return info, items[start : start + per_page]
+
+
+class StandIn:
+    """aiohttp app answering AniList GraphQL queries from `catalog`.
+
+    Every request sleeps for `latency` (+- `jitter`) seconds, then fails with
+    a 500 at `error_rate` or a 429 at `throttle_rate`. `requests` counts
+    what was asked for by query name."""
+
+    def __init__(
+        self,
+        catalog,
+        *,
+        latency=0.05,
+        jitter=0.02,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        rate_limit=None,
+        recordings=None,
+        upstream=None,
+        seed=2264,
+    ):
+        self.catalog = catalog
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        # query name: {variables as sorted JSON: response body}
+        self.recordings = recordings if recordings is not None else {}
+        self.upstream = upstream
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.errors = Counter()
+        self.replayed = 0
+        self.airings = {}
+        for media in catalog.values():
+            if media["nextAiringEpisode"]:
+                nxt = media["nextAiringEpisode"]
+                self.airings[media["id"] * 100 + nxt["episode"]] = media
+        self.mal = {m["idMal"]: m for m in catalog.values() if m["idMal"]}
+        self.app = web.Application()
+        self.app.router.add_post("/", self.handle)
+        self.runner = None
+        self._upstream = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving, returns the URL to point `ANILIST_URL` at."""
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._upstream is not None:
+            await self._upstream.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def headers(self):
+        if not self.rate_limit:
+            return {}
+        return {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(self.rate_limit),
+        }
+
+    async def handle(self, request):
+        body = await request.json()
+        name = classify(body.get("query", ""))
+        variables = body.get("variables") or {}
+        self.requests[name] += 1
+        await asyncio.sleep(max(self.rng.gauss(self.latency, self.jitter), 0))
+
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            self.errors[name] += 1
+            return self.error(500, "Internal Server Error")
+        if roll < self.error_rate + self.throttle_rate:
+            self.errors[name] += 1
+            response = self.error(429, "Too Many Requests")
+            response.headers["Retry-After"] = "1"
+            return response
+
+        key = json.dumps(variables, sort_keys=True)
+        recorded = self.recordings.get(name, {}).get(key)
+        if recorded is None and self.upstream:
+            recorded = await self.forward(body)
+            self.recordings.setdefault(name, {})[key] = recorded
+        if recorded is not None:
+            self.replayed += 1
+            return web.json_response(recorded, headers=self.headers())
+
+        data = self.answer(name, variables)
+        if data is None:
+            return self.error(404, "Not Found.")
+        return web.json_response({"data": data}, headers=self.headers())
+
+    def error(self, status, message):
+        return web.json_response(
+            {"errors": [{"message": message, "status": status}], "data": None},
+            status=status,
+            headers=self.headers(),
+        )
+
+    async def forward(self, body):
+        if self._upstream is None:
+            self._upstream = aiohttp.ClientSession()
+        async with self._upstream.post(self.upstream, json=body) as resp:
+            return await resp.json()
+
+    def media(self, media):
+        if media["nextAiringEpisode"]:
+            nxt = dict(media["nextAiringEpisode"])
+            nxt["timeUntilAiring"] = nxt["airingAt"] - int(time.time())
+            media = dict(media, nextAiringEpisode=nxt)
+        return media
+
+    def search(self, name, format=None):
+        name = (name or "").lower()
+        return [
+            m
+            for m in self.catalog.values()
+            if name in m["title"]["romaji"].lower()
+            or name in (m["title"]["english"] or "").lower()
+            if not format or m["format"] == format
+        ]
+
+    def answer(self, name, v):
+        if name == "schedule":
+            watched = set(v.get("watched") or ())
+            before = v.get("nextDay") or 0
+            now = int(time.time())
+            airing = sorted(
+                (
+                    (m["nextAiringEpisode"]["airingAt"], airing_id, m)
+                    for airing_id, m in self.airings.items()
+                    if m["id"] in watched
+                    and now < m["nextAiringEpisode"]["airingAt"] < before
+                ),
+                key=lambda a: a[0],
+            )
+            info, items = page(airing, v.get("page"), v.get("amount") or 50)
+            return {
+                "Page": {
+                    "pageInfo": info,
+                    "airingSchedules": [
+                        {
+                            "id": airing_id,
+                            "episode": m["nextAiringEpisode"]["episode"],
+                            "airingAt": airing_at,
+                            "timeUntilAiring": airing_at - now,
+                            "media": dict(
+                                m,
+                                studios={
+                                    "edges": [
+                                        {"isMain": True, "node": node}
+                                        for node in m["studios"]["nodes"]
+                                    ]
+                                },
+                            ),
+                        }
+                        for airing_at, airing_id, m in items
+                    ],
+                }
+            }
+        if name == "airing":
+            media = self.airings.get(v.get("id"))
+            if media is None:
+                return {"AiringSchedule": None}
+            return {
+                "AiringSchedule": {
+                    "id": v["id"],
+                    "airingAt": media["nextAiringEpisode"]["airingAt"],
+                }
+            }
+        if name == "list":
+            ids = v.get("mediaId") or []
+            found = [self.catalog[i] for i in ids if i in self.catalog]
+            info, items = page(found, v.get("page"), v.get("amount") or 50)
+            return {"Page": {"pageInfo": info, "media": [self.media(m) for m in items]}}
+        if name == "search":
+            found = self.search(v.get("name"), v.get("aniformat"))
+            info, items = page(found, v.get("page"), v.get("amount") or 5)
+            return {"Page": {"pageInfo": info, "media": [self.media(m) for m in items]}}
+        if name == "name":
+            found = self.search(v.get("name"), v.get("atype"))
+            return {"Media": self.media(found[0])} if found else None
+        if name == "mal":
+            media = self.mal.get(int(v.get("malId") or 0))
+            return {"Media": {"id": media["id"]}} if media else None
+        return None
+
+
+async def serve(port=8080, amount=2000, latency=50, error_rate=0.0, path=None):
+    recordings = {}
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            recordings = json.load(f)
+    server = StandIn(
+        make_catalog(amount),
+        latency=latency / 1000,
+        jitter=latency / 2500,
+        error_rate=error_rate,
+        recordings=recordings,
+        upstream=os.getenv("ANILIST_UPSTREAM"),
+    )
+    url = await server.start(port=port)
+    print(f"Serving {amount} media on {url}, stop with Ctrl+C")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        print(", ".join(f"{k}: {v}" for k, v in server.requests.items()) or "idle")
+        if path and server.upstream:
+            with open(path, "w") as f:
+                json.dump(server.recordings, f)
+        await server.stop()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    try:
+        asyncio.run(
+            serve(
+                int(args[0]) if args else 8080,
+                int(args[1]) if len(args) > 1 else 2000,
+                float(args[2]) if len(args) > 2 else 50,
+                float(args[3]) if len(args) > 3 else 0.0,
+                args[4] if len(args) > 4 else None,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
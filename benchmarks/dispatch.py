@@ -0,0 +1,111 @@
+"""Message dispatch replay benchmark.
+
+Replays recorded message content (one message per line, or a generated
+sample) through the old `process_commands` + custom command lookup and the
+new single-pass `ziBot.on_message`. Commands are resolved but not run.
+
+    python3 -m benchmarks.dispatch [messages.txt] [repeat]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from types import SimpleNamespace
+
+SAMPLE = [
+    "lol",
+    "anyone up for a run tonight?",
+    ">help",
+    ">wrs any",
+    ">anime info Kimi_no_Na_Wa",
+    ">rules",
+    "z!ping",
+    ">notacommand",
+    "https://www.speedrun.com/mcbe",
+    "",
+]
+
+
+def load_messages(path=None, amount=20000):
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f]
+    random.seed(2264)
+    return [random.choice(SAMPLE) for _ in range(amount)]
+
+
+def make_message(content, guild, bot_author=False):
+    async def send(*args, **kwargs):
+        pass
+
+    return SimpleNamespace(
+        content=content,
+        guild=guild,
+        author=SimpleNamespace(id=3, bot=bot_author),
+        webhook_id=None,
+        _state=None,
+        channel=SimpleNamespace(send=send),
+    )
+
+
+async def legacy_on_message(bot, message):
+    # ziBot.on_message before the single-pass dispatcher
+    await bot.process_commands(message)
+
+    try:
+        command = message.content.split()[0]
+    except IndexError:
+        pass
+
+    try:
+        if command in bot.custom_commands[str(message.guild.id)]:
+            await message.channel.send(bot.custom_commands[str(message.guild.id)][command])
+            return
+    except:
+        return
+
+
+async def bench(label, func, messages):
+    start = time.process_time()
+    for message in messages:
+        await func(message)
+    elapsed = time.process_time() - start
+    print(
+        f"{label:<8} {len(messages) / elapsed:>12,.0f} messages/sec"
+        + f" ({elapsed / len(messages) * 1e6:.2f}us CPU per message)"
+    )
+
+
+async def main(path=None, repeat=1):
+    os.chdir(tempfile.mkdtemp())
+    from bot import ziBot, get_prefix
+
+    bot = ziBot(command_prefix=get_prefix, case_insensitive=True)
+
+    async def noop(ctx):
+        pass
+
+    for name in ["wrs", "anime", "ping", "pending"]:
+        bot.command(name=name)(noop)
+    bot.invoke = noop
+    bot._connection.user = SimpleNamespace(id=2)
+
+    guild = SimpleNamespace(id=1)
+    bot.config["1"] = {"mention_as_prefix": False, "prefix": [">", "z!"]}
+    bot.custom_commands["1"] = {">rules": "Be nice.", ">faq": "Read the pins."}
+    messages = [
+        make_message(content, guild, bot_author=i % 10 == 0)
+        for i, content in enumerate(load_messages(path) * repeat)
+    ]
+
+    await bench("before", lambda m: legacy_on_message(bot, m), messages)
+    await bench("after", bot.on_message, messages)
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(args[0] if args else None, int(args[1]) if len(args) > 1 else 1))
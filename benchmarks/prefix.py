@@ -0,0 +1,86 @@
+"""Prefix resolution micro-benchmark.
+
+Compares the old per-message `data/guild.json` read against the in-memory
+`PrefixCache`. Run from the repository root:
+
+    python3 -m benchmarks.prefix [guilds] [messages]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from types import SimpleNamespace
+from utilities.prefix import PrefixCache
+
+
+def legacy_get_prefix(path, message):
+    with open(path, "r") as f:
+        prefixes = json.load(f)
+    guild = prefixes[str(message.guild.id)]
+    if guild["mention_as_prefix"]:
+        return [f"<@1> ", f"<@!1> "] + guild["prefix"]
+    return guild["prefix"]
+
+
+def legacy_match(prefix, content):
+    # What discord.py does with a list returned from get_prefix
+    if content.startswith(tuple(prefix)):
+        for p in prefix:
+            if content.startswith(p):
+                return p
+    return None
+
+
+def make_config(guilds):
+    config = {}
+    for i in range(guilds):
+        prefix = random.sample([">", ">>", "!", "z!", "?", "zi.", "$"], 3)
+        config[str(i)] = {"mention_as_prefix": bool(i % 2), "prefix": prefix}
+    return config
+
+
+def make_messages(guilds, amount):
+    words = [">help", "hello there", "z!ping", "!wrs any", "lol", "zi.anime info"]
+    return [
+        SimpleNamespace(
+            guild=SimpleNamespace(id=random.randrange(guilds)),
+            content=random.choice(words),
+        )
+        for _ in range(amount)
+    ]
+
+
+def bench(label, func, messages):
+    start = time.perf_counter()
+    for message in messages:
+        func(message)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {len(messages) / elapsed:>14,.0f} messages/sec")
+
+
+def main(guilds=500, amount=20000):
+    random.seed(2264)
+    config = make_config(guilds)
+    messages = make_messages(guilds, amount)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "guild.json")
+        with open(path, "w") as f:
+            json.dump(config, f, indent=4)
+
+        bench(
+            "before",
+            lambda m: legacy_match(legacy_get_prefix(path, m), m.content),
+            messages,
+        )
+
+    bot = SimpleNamespace(config=config, def_prefix=">", user=SimpleNamespace(id=1))
+    cache = PrefixCache(bot)
+    bench("after", lambda m: cache.get(m.guild).match(m.content), messages)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -1,4 +1,3 @@
-import aiohttp
 import discord
 import json
 import logging
@@ -6,8 +5,16 @@ import os
 import time
 
 from discord.errors import NotFound
-from discord.ext import commands
+from discord.ext import commands, tasks
+from discord.ext.commands.view import StringView
 from dotenv import load_dotenv
+from utilities.http import HTTPClient
+from utilities.metrics import Metrics
+from utilities.prefix import PrefixCache
+from utilities.startup import ExtensionTimer
+from utilities.storage import atomic_write, get_storage
+from utilities.watchdog import StallWatchdog
+from utilities.webhooks import BulkPoster
 
 # Create data directory if its not exist
 try:
@@ -23,26 +30,14 @@ except:
 
 shard = os.getenv("SHARD") or 0
 shard_count = os.getenv("SHARD_COUNT") or 1
-
-
-def check_jsons():
-    try:
-        f = open("data/guild.json", "r")
-    except FileNotFoundError:
-        with open("data/guild.json", "w+") as f:
-            json.dump({}, f, indent=4)
-
-    try:
-        f = open("data/custom_commands.json", "r")
-    except FileNotFoundError:
-        with open("data/custom_commands.json", "w+") as f:
-            json.dump({}, f, indent=4)
-
-    try:
-        f = open("data/anime.json", "r")
-    except FileNotFoundError:
-        with open("data/anime.json", "w+") as f:
-            json.dump({"watchlist": []}, f, indent=4)
+# Set by the launcher (`python3 zibot.py launch`) for each cluster process
+shard_ids = os.getenv("SHARD_IDS")
+cluster_id = os.getenv("CLUSTER_ID")
+# Prometheus endpoint, every cluster gets its own port. Set to 0 to disable
+metrics_host = os.getenv("METRICS_HOST") or "127.0.0.1"
+metrics_port = int(os.getenv("METRICS_PORT") or 9100)
+# Log the stack of anything blocking the event loop longer than this (seconds)
+stall_threshold = float(os.getenv("STALL_THRESHOLD") or 0.25)
 
 
 def get_cogs():
@@ -68,48 +63,53 @@ start_time = time.time()
 
 def get_prefix(bot, message):
     """A callable Prefix for our bot. This could be edited to allow per server prefixes."""
-
-    with open("data/guild.json", "r") as f:
-        prefixes = json.load(f)
-
-    if prefixes[str(message.guild.id)]["mention_as_prefix"]:
-        return commands.when_mentioned_or(*prefixes[str(message.guild.id)]["prefix"])(
-            bot, message
-        )
-    return prefixes[str(message.guild.id)]["prefix"]
+    matcher = bot.prefixes.get(message.guild)
+    # Hand back only the matched prefix so discord.py doesn't rescan the list
+    return matcher.match(message.content) or matcher.prefixes
 
 
-class ziBot(commands.Bot):
+class ziBot(commands.AutoShardedBot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.logger = logging.getLogger("discord")
-        self.session = aiohttp.ClientSession()
+        # Shared by every cog, don't close it from a cog
+        self.session = HTTPClient(headers={"User-Agent": "ziBot/0.2"})
+        # Feeds posting lots of embeds at once, 10 per webhook message
+        self.poster = BulkPoster(self)
         self.def_prefix = ">"
 
         self.master = [186713080841895936]
 
-        check_jsons()
+        # JSON files by default, set STORAGE=sqlite for bigger installs
+        self.storage = get_storage()
+        # Only load guilds that live on our shards
+        self.custom_commands = self.storage.load_custom_commands(
+            self.shard_ids, self.shard_count
+        )
+        self.config = self.storage.load_config(self.shard_ids, self.shard_count)
 
-        with open("data/custom_commands.json", "r") as cc:
-            self.custom_commands = json.load(cc)
+        self.prefixes = PrefixCache(self)
+        self.metrics = Metrics(self)
+        self.watchdog = StallWatchdog(self, stall_threshold)
 
-        with open("data/guild.json", "r") as ch:
-            self.config = json.load(ch)
+        # (import, setup) seconds of each extension and time until first ready
+        self.extension_times = {}
+        self.ready_time = None
 
     async def on_guild_join(self, guild):
-        with open("data/guild.json", "w") as f:
-            self.config[str(guild.id)] = {}
-            self.config[str(guild.id)]["mention_as_prefix"] = False
-            self.config[str(guild.id)]["prefix"] = [self.def_prefix]
+        self.config[str(guild.id)] = {}
+        self.config[str(guild.id)]["mention_as_prefix"] = False
+        self.config[str(guild.id)]["prefix"] = [self.def_prefix]
 
-            json.dump(self.config, f, indent=4)
+        self.storage.save_guild(guild.id, self.config[str(guild.id)])
+        self.prefixes.invalidate(guild)
 
     async def on_guild_remove(self, guild):
-        with open("data/guild.json", "w") as f:
-            del self.config[str(guild.id)]
+        self.config.pop(str(guild.id), None)
 
-            json.dump(self.config, f, indent=4)
+        self.storage.delete_guild(guild.id)
+        self.prefixes.invalidate(guild)
 
     async def on_ready(self):
         activity = discord.Activity(
@@ -117,27 +117,126 @@ class ziBot(commands.Bot):
         )
         await self.change_presence(activity=activity)
 
-        for extension in extensions:
-            self.load_extension(extension)
+        # Mention prefixes depend on self.user, which only exists from now on
+        self.prefixes.invalidate()
+
+        if self.ready_time is None:
+            self.ready_time = time.time() - start_time
+            self.logger.warning(f"Ready in {self.ready_time:.2f}s")
 
         self.logger.warning(f"Online: {self.user} (ID: {self.user.id})")
 
-    async def on_message(self, message):
-        await self.process_commands(message)
+    def load_extensions(self):
+        """Load every extension once, timing their import and setup."""
+        with ExtensionTimer(extensions) as timer:
+            for extension in extensions:
+                start = time.perf_counter()
+                try:
+                    self.load_extension(extension)
+                except commands.ExtensionError:
+                    self.logger.exception(f"Failed to load extension {extension}:")
+                    continue
+                imported = timer.times.get(extension, 0)
+                setup = time.perf_counter() - start - imported
+                self.extension_times[extension] = (imported, setup)
+                self.logger.info(
+                    f"Loaded {extension} (import {imported * 1000:.1f}ms"
+                    + f", setup {setup * 1000:.1f}ms)"
+                )
+        total = sum(i + s for i, s in self.extension_times.values())
+        self.logger.warning(
+            f"Loaded {len(self.extension_times)}/{len(extensions)} extensions"
+            + f" in {total:.2f}s"
+        )
 
-        try:
-            command = message.content.split()[0]
-        except IndexError:
-            pass
+    async def start(self, *args, **kwargs):
+        # Load cogs before connecting, on_ready fires again on every reconnect
+        self.load_extensions()
+        port = metrics_port + int(cluster_id or 0) if metrics_port else 0
+        await self.metrics.start(metrics_host, port)
+        self.watchdog.start()
+        # Beat while still identifying too, big shard ranges take a while and
+        # the launcher kills clusters that stay quiet
+        if cluster_id is not None:
+            self.heartbeat.start()
+        await super().start(*args, **kwargs)
+
+    @tasks.loop(seconds=30)
+    async def heartbeat(self):
+        """Let the launcher know this cluster is still alive."""
+        beat = {
+            "time": time.time(),
+            "pid": os.getpid(),
+            "shards": self.shard_ids,
+            "ready": self.is_ready(),
+            # NaN until the shards connected
+            "latency": self.latency if self.is_ready() else None,
+            "guilds": len(self.guilds),
+        }
+        await self.loop.run_in_executor(
+            None, atomic_write, f"data/cluster-{cluster_id}.json", json.dumps(beat)
+        )
 
-        try:
-            if command in self.custom_commands[str(message.guild.id)]:
-                await message.channel.send(
-                    self.custom_commands[str(message.guild.id)][command]
+    async def on_command(self, ctx):
+        self.metrics.command_started(ctx)
+
+    async def on_command_completion(self, ctx):
+        self.metrics.command_finished(ctx)
+
+    async def on_command_error(self, ctx, error):
+        self.metrics.command_finished(ctx, error)
+        await super().on_command_error(ctx, error)
+
+    def resolve_command(self, message):
+        """Tokenise a message once and find out what it triggers.
+
+        Returns a ready to invoke Context for built-in commands, the reply
+        for custom commands or None."""
+        content = message.content
+        prefix = self.prefixes.get(message.guild).match(content)
+        if prefix:
+            view = StringView(content)
+            view.skip_string(prefix)
+            invoker = view.get_word()
+            command = self.all_commands.get(invoker)
+            if command:
+                return commands.Context(
+                    prefix=prefix,
+                    view=view,
+                    bot=self,
+                    message=message,
+                    invoked_with=invoker,
+                    command=command,
                 )
-                return
-        except:
+
+        # Custom commands are stored with the prefix they were created with
+        custom = self.custom_commands.get(str(message.guild.id))
+        tokens = content.split(None, 1)
+        if not custom or not tokens:
+            return None
+        return custom.get(tokens[0])
+
+    async def on_message(self, message):
+        # Bots, webhooks and DMs never trigger commands
+        if message.author.bot or message.webhook_id or not message.guild:
+            return
+
+        resolved = self.resolve_command(message)
+        if resolved is None:
+            return
+        if isinstance(resolved, str):
+            await message.channel.send(resolved)
             return
+        await self.invoke(resolved)
+
+    async def close(self):
+        await super().close()
+        self.watchdog.stop()
+        await self.metrics.stop()
+        await self.session.close()
+        # Flush pending write-behind data before the loop goes away
+        await self.storage.flush()
+        self.storage.close()
 
     def run(self):
         super().run(token, reconnect=True)
@@ -2,19 +2,31 @@ import aiohttp
 import asyncio
 import datetime
 import discord
-import json
 import logging
+import os
 import pytz
 import re
 import time
 
-from cogs.errors.anilist import NameNotFound, NameTypeNotFound, IdNotFound
+from cogs.errors.anilist import (
+    AniListUnavailable,
+    NameNotFound,
+    NameTypeNotFound,
+    IdNotFound,
+)
 from discord.ext import tasks, commands
 from pytz import timezone
 from typing import Optional
+from utilities.cache import MediaCache
 from utilities.formatting import hformat, realtime
+from utilities.idmap import IdMap
+from utilities.loader import DataLoader
+from utilities.ratelimit import BACKGROUND, INTERACTIVE, RateGovernor
+from utilities.scheduling import Scheduler
+from utilities.titles import TitleIndex
 
-session = aiohttp.ClientSession()
+# Point it at `python3 -m benchmarks.anilist_server` to test without AniList
+ANILIST_URL = os.getenv("ANILIST_URL") or "https://graphql.anilist.co"
 
 streamingSites = [
     "Amazon",
@@ -71,71 +83,88 @@ query($page: Int = 0, $amount: Int = 50, $watched: [Int!]!, $nextDay: Int!) {
 }
 """
 
-searchAni = """
+# Every field our embeds use, shared by all media queries so whatever we
+# fetch can go into the media cache
+mediaFragment = """
+fragment media on Media {
+    id,
+    format,
+    title {
+        romaji,
+        english
+    },
+    siteUrl,
+    idMal,
+    synonyms,
+    episodes,
+    duration,
+    status,
+    startDate {
+        year,
+        month,
+        day
+    },
+    endDate {
+        year,
+        month,
+        day
+    },
+    genres,
+    coverImage {
+        large
+    },
+    bannerImage,
+    description,
+    averageScore,
+    studios{nodes{name}},
+    seasonYear,
+    externalLinks {
+        site,
+        url
+    },
+    nextAiringEpisode {
+        episode,
+        airingAt,
+        timeUntilAiring
+    }
+}
+"""
+
+searchAni = (
+    """
 query($name:String,$aniformat:MediaFormat,$page:Int,$amount:Int=5){
     Page(perPage:$amount,page:$page){
-        pageInfo{hasNextPage, currentPage, lastPage}
+        pageInfo{hasNextPage, currentPage, lastPage, total}
         media(search:$name,type:ANIME,format:$aniformat){
-            title {
-                romaji, 
-                english
-            },
-            id,
-            format,
-            episodes, 
-            duration,
-            status, 
-            genres, 
-            averageScore, 
-            siteUrl,
-            studios{nodes{name}}, 
-            coverImage {large},
-            bannerImage
+            ...media
         }
-    } 
+    }
 }
 """
-
-generalQ = """
-query($mediaId: Int){
-    Media(id:$mediaId, type:ANIME){
-        id,
-        format,
-        title {
-            romaji, 
-            english
-        }, 
-        episodes, 
-        duration,
-        status, 
-        startDate {
-            year, 
-            month, 
-            day
-        }, 
-        endDate {
-            year, 
-            month, 
-            day
-        }, 
-        genres, 
-        coverImage {
-            large
-        }, 
-        bannerImage,
-        description, 
-        averageScore, 
-        studios{nodes{name}}, 
-        seasonYear, 
-        externalLinks {
-            site, 
-            url
-        } 
-    } 
+    + mediaFragment
+)
+
+airingQuery = """
+query($id: Int) {
+  AiringSchedule(id: $id) {
+    id
+    airingAt
+  }
 }
 """
 
-listQ = """
+# Seconds before airing to check if an episode got delayed or cancelled
+REVALIDATE_BEFORE = 5 * 60
+# Seconds between revalidations while AniList can't be reached
+REVALIDATE_RETRY = 60
+# Seconds until a failed schedule refresh is tried again
+SCHEDULE_RETRY = 10 * 60
+# Media ids per schedule query, AniList pages are at most 50 long anyway
+SCHEDULE_CHUNK = 50
+
+# Media by id, also used to batch single lookups (see AniList.media)
+listQ = (
+    """
 query($page: Int = 0, $amount: Int = 50, $mediaId: [Int!]!) {
   Page(page: $page, perPage: $amount) {
     pageInfo {
@@ -143,54 +172,98 @@ query($page: Int = 0, $amount: Int = 50, $mediaId: [Int!]!) {
       hasNextPage
     }
     media(id_in: $mediaId, type:ANIME){
-        id,
-        title {
-            romaji,
-            english
-        },
-        siteUrl,
-        nextAiringEpisode {
-            episode,
-            airingAt,
-            timeUntilAiring
-        }
+        ...media
     }
   }
 }
 """
+    + mediaFragment
+)
+
+
+def media_expiry(media):
+    """When cached media should be refetched, depends on its airing status."""
+    now = time.time()
+    if media["status"] in ("FINISHED", "CANCELLED"):
+        return now + 30 * 24 * 60 * 60
+    if media["nextAiringEpisode"]:
+        # Episode count and next airing change once it airs
+        return min(media["nextAiringEpisode"]["airingAt"] + 5 * 60, now + 24 * 60 * 60)
+    return now + 6 * 60 * 60
+
+
+async def query(
+    self,
+    query: str,
+    variables: Optional[str],
+    cache: Optional[str] = None,
+    priority: int = INTERACTIVE,
+):
+    if not query:
+        return None
+    req = await self.bot.session.post(
+        ANILIST_URL,
+        json={"query": query, "variables": variables},
+        retries=2,
+        cache=cache,
+        limiter=self.governor,
+        priority=priority,
+    )
+    if req.status != 200:
+        return None
+    try:
+        body = req.json()
+    except ValueError:
+        # e.g. a gateway's HTML error page
+        return None
+    if body.get("errors"):
+        return None
+    return body
 
 
-def checkjson():
-    try:
-        f = open("data/anime.json", "r")
-    except FileNotFoundError:
-        with open("data/anime.json", "w+") as f:
-            json.dump({"watchlist": []}, f, indent=4)
+async def fetch_media(self, ids):
+    """Batch function of `AniList.media`, one request per 50 ids."""
+    q = await query(self, listQ, {"mediaId": ids, "amount": len(ids)})
+    if not q:
+        return {}
+    return {media["id"]: media for media in q["data"]["Page"]["media"]}
 
 
-async def query(query: str, variables: Optional[str]):
-    if not query:
-        return None
-    async with session.post(
-        "https://graphql.anilist.co", json={"query": query, "variables": variables}
-    ) as req:
-        try:
-            if json.loads(await req.text())["errors"]:
-                return None
-        except KeyError:
-            return json.loads(await req.text())
+def remember_media(self, media):
+    """Keep fetched media in the media cache and title index."""
+    self.media_cache.set(media["id"], media, media_expiry(media))
+    self.titles.add(media)
+    if media["idMal"]:
+        self.mal_ids.add(media["idMal"], media["id"])
+
+
+async def get_media(self, media_id):
+    """Get media from the media cache, or AniList if it's not fresh."""
+    media = self.media_cache.get(media_id)
+    if media is None:
+        media = await self.media.load(media_id)
+        if media is not None:
+            remember_media(self, media)
+    return media
+
+
+def watched(self):
+    """Every media id watched by at least one guild."""
+    return set().union(*self.watchlists.values())
 
 
 async def getwatchlist(self, ctx):
-    a = await query(listQ, {"mediaId": self.watchlist})
-    a = a["data"]
+    watchlist = self.watchlists.get(str(ctx.guild.id), [])
+    watched = await asyncio.gather(*[get_media(self, i) for i in watchlist])
     embed = discord.Embed(title="Anime Watchlist", colour=discord.Colour(0x02A9FF))
     embed.set_author(
         name="AniList",
         icon_url="https://gblobscdn.gitbook.com/spaces%2F-LHizcWWtVphqU90YAXO%2Favatar.png",
     )
     jakarta = timezone("Asia/Jakarta")
-    for e in a["Page"]["media"]:
+    for e in watched:
+        if e is None:
+            continue
         if e["nextAiringEpisode"]:
             status = "AIRING"
             _time_ = str(
@@ -198,8 +271,13 @@ async def getwatchlist(self, ctx):
                     e["nextAiringEpisode"]["airingAt"], tz=jakarta
                 ).strftime("%d %b %Y - %H:%M WIB")
             )
+            # Cached media might be a while old, timeUntilAiring isn't accurate
             _timeTillAired_ = str(
-                datetime.timedelta(seconds=e["nextAiringEpisode"]["timeUntilAiring"])
+                datetime.timedelta(
+                    seconds=max(
+                        0, e["nextAiringEpisode"]["airingAt"] - int(time.time())
+                    )
+                )
             )
             embed.add_field(
                 name=f"{e['title']['romaji']} ({e['id']})",
@@ -214,79 +292,268 @@ async def getwatchlist(self, ctx):
                 value=status or "...",
                 inline=False,
             )
+    if not watchlist:
+        embed.description = "This server isn't watching anything."
     await ctx.send(embed=embed)
 
 
-async def getschedule(self, _time_, page):
-    q = await query(
-        scheduleQuery,
-        {"page": 1, "amount": 50, "watched": self.watchlist, "nextDay": _time_},
-    )
-    q = q["data"]
-    channel = self.bot.get_channel(744528830382735421)
-    if q["Page"]["airingSchedules"]:
+async def fetch_airing(self, watched, _time_):
+    """Airing schedules of `watched` before `_time_`, None if AniList failed."""
+    airing = {}
+    page = 1
+    while True:
+        q = await query(
+            self,
+            scheduleQuery,
+            {"page": page, "amount": 50, "watched": watched, "nextDay": _time_},
+            priority=BACKGROUND,
+        )
+        if not q:
+            return None
+        q = q["data"]
         for e in q["Page"]["airingSchedules"]:
+            airing[str(e["id"])] = e
+        if not q["Page"]["pageInfo"]["hasNextPage"]:
+            return airing
+        page += 1
+
+
+def schedule_airing(self, airing):
+    """Schedule the announcement (and revalidation) of `airing` schedules."""
+    for key, e in airing.items():
+        self.logger.info(
+            f"Scheduling {e['media']['title']['romaji']} episode {e['episode']}"
+            + f" (about to air in {datetime.timedelta(seconds=e['timeUntilAiring'])})"
+        )
+        release = {
+            "id": e["media"]["id"],
+            "title": e["media"]["title"]["romaji"],
+            "episode": e["episode"],
+            "airingAt": e["airingAt"],
+            "embed": release_embed(e).to_dict(),
+        }
+        self.scheduler.schedule(key, e["airingAt"], release)
+        # Make sure it's still airing right before announcing it
+        if e["airingAt"] - REVALIDATE_BEFORE > time.time():
+            self.revalidator.schedule(
+                key, e["airingAt"] - REVALIDATE_BEFORE, {"id": e["id"]}
+            )
+
+
+async def schedule_media(self, media_id):
+    """Schedule a newly watched show without refetching everything else."""
+    try:
+        airing = await fetch_airing(self, [media_id], int(time.time() + 25 * 60 * 60))
+    except Exception:
+        self.logger.exception(f"Fetching the airing schedule of {media_id} failed:")
+        return
+    if airing is None:
+        self.logger.warning(
+            f"Couldn't fetch the airing schedule of {media_id},"
+            + " leaving it to the next refresh"
+        )
+        return
+    schedule_airing(self, airing)
+
+
+async def getschedule(self, _time_):
+    """Schedule announcements of every watched episode airing before `_time_`.
+
+    Returns the airing schedules, None if some couldn't be fetched."""
+    # One fetch for every guild, no matter how many watch the same show
+    ids = sorted(watched(self))
+    chunks = [ids[i : i + SCHEDULE_CHUNK] for i in range(0, len(ids), SCHEDULE_CHUNK)]
+    results = await asyncio.gather(
+        *[fetch_airing(self, c, _time_) for c in chunks], return_exceptions=True
+    )
+    airing = {}
+    failed = 0
+    for result in results:
+        if isinstance(result, Exception):
+            self.logger.warning(f"Fetching airing schedules failed: {result!r}")
+        if result is None or isinstance(result, Exception):
+            failed += 1
+            continue
+        airing.update(result)
+
+    schedule_airing(self, airing)
+
+    if failed:
+        self.logger.error(
+            f"Failed to fetch {failed}/{len(chunks)} airing schedule chunks"
+            + " from AniList"
+        )
+        # Without every chunk we can't tell what's no longer airing
+        return None
+
+    # Delayed or removed episodes we already scheduled
+    for due, key, release in self.scheduler.pending():
+        if due <= _time_ and key not in airing:
             self.logger.info(
-                f"Scheduling {e['media']['title']['romaji']} episode {e['episode']} (about to air in {str(datetime.timedelta(seconds=e['timeUntilAiring']))})"
+                f"{release['title']} episode {release['episode']}"
+                + " is no longer airing at its scheduled time"
             )
+            self.scheduler.cancel(key)
+            self.revalidator.cancel(key)
+    return airing
 
-            async def queueSchedule(self):
-                anime = e["media"]["title"]["romaji"]
-                id = e["media"]["id"]
-                eps = e["episode"]
-                sites = []
-                for site in e["media"]["externalLinks"]:
-                    if str(site["site"]) in streamingSites:
-                        sites.append(f"[{site['site']}]({site['url']})")
-                sites = " | ".join(sites)
-                _date_ = datetime.datetime.fromtimestamp(e["airingAt"])
-                embed = discord.Embed(
-                    title="New Release!",
-                    description=f"Episode {eps} of [{anime}]({e['media']['siteUrl']}) ({id}) has just aired!",
-                    timestamp=_date_,
-                    colour=discord.Colour(0x02A9FF),
-                )
-                embed.set_author(
-                    name="AniList",
-                    icon_url="https://gblobscdn.gitbook.com/spaces%2F-LHizcWWtVphqU90YAXO%2Favatar.png",
-                )
-                embed.set_thumbnail(url=e["media"]["coverImage"]["large"])
-                if sites:
-                    embed.add_field(name="Streaming Sites", value=sites, inline=False)
-                else:
-                    embed.add_field(
-                        name="Streaming Sites",
-                        value="No official stream links available",
-                    )
-                if id in self.watchlist:
-                    await channel.send(embed=embed)
-                else:
-                    self.logger.warning(f"{anime} ({id}) no longer in the watchlist.")
 
-            await asyncio.sleep(e["timeUntilAiring"])
-            # ---- For testing only
-            # await asyncio.sleep(5)
-            await queueSchedule(self)
+def release_embed(e):
+    """Build the "New Release!" embed of an airing schedule."""
+    anime = e["media"]["title"]["romaji"]
+    id = e["media"]["id"]
+    eps = e["episode"]
+    sites = []
+    for site in e["media"]["externalLinks"]:
+        if str(site["site"]) in streamingSites:
+            sites.append(f"[{site['site']}]({site['url']})")
+    sites = " | ".join(sites)
+    _date_ = datetime.datetime.fromtimestamp(e["airingAt"], tz=datetime.timezone.utc)
+    embed = discord.Embed(
+        title="New Release!",
+        description=f"Episode {eps} of [{anime}]({e['media']['siteUrl']}) ({id}) has just aired!",
+        timestamp=_date_,
+        colour=discord.Colour(0x02A9FF),
+    )
+    embed.set_author(
+        name="AniList",
+        icon_url="https://gblobscdn.gitbook.com/spaces%2F-LHizcWWtVphqU90YAXO%2Favatar.png",
+    )
+    embed.set_thumbnail(url=e["media"]["coverImage"]["large"])
+    if sites:
+        embed.add_field(name="Streaming Sites", value=sites, inline=False)
+    else:
+        embed.add_field(
+            name="Streaming Sites",
+            value="No official stream links available",
+        )
+    return embed
+
 
-    if q["Page"]["pageInfo"]["hasNextPage"]:
-        getschedule(self, int(time.time() + (24 * 60 * 60 * 1000 * 1) / 1000), page + 1)
+async def airing_at(self, airing_id):
+    """When an airing schedule airs, None if AniList says it's gone.
+
+    Raises AniListUnavailable when AniList couldn't tell, e.g. throttled."""
+    try:
+        req = await self.bot.session.post(
+            ANILIST_URL,
+            json={"query": airingQuery, "variables": {"id": airing_id}},
+            retries=2,
+            limiter=self.governor,
+            priority=BACKGROUND,
+        )
+        body = req.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        raise AniListUnavailable(repr(e)) from e
+    if req.status == 404:
+        return None
+    if req.status != 200 or body.get("errors") or not body.get("data"):
+        raise AniListUnavailable(f"AniList answered {req.status}")
+    schedule = body["data"]["AiringSchedule"]
+    return schedule["airingAt"] if schedule else None
+
+
+async def revalidate(self, key, payload):
+    """Revalidator callback, respect delays and cancellations announced late."""
+    try:
+        airingAt = await airing_at(self, payload["id"])
+    except AniListUnavailable as e:
+        # Keep the announcement, one blip shouldn't drop it for every guild
+        self.logger.warning(f"Couldn't revalidate airing schedule {key}: {e}")
+        timer = self.scheduler.timers.get(key)
+        retry = time.time() + REVALIDATE_RETRY
+        if timer is not None and retry < timer[0]:
+            self.revalidator.schedule(key, retry, payload)
+        return
+    timer = self.scheduler.timers.get(key)
+    if timer is None:
+        return
+    due, release = timer
+    if airingAt is None:
+        self.logger.warning(
+            f"{release['title']} episode {release['episode']} got cancelled"
+        )
+        self.scheduler.cancel(key)
+        return
+    if airingAt != release["airingAt"]:
+        self.logger.warning(
+            f"{release['title']} episode {release['episode']} got delayed"
+            + f" by {datetime.timedelta(seconds=airingAt - release['airingAt'])}"
+        )
+        embed = discord.Embed.from_dict(release["embed"])
+        embed.timestamp = datetime.datetime.fromtimestamp(
+            airingAt, tz=datetime.timezone.utc
+        )
+        release = dict(release, airingAt=airingAt, embed=embed.to_dict())
+        self.scheduler.schedule(key, airingAt, release)
+        # It might get delayed or cancelled again
+        if airingAt - REVALIDATE_BEFORE > time.time():
+            self.revalidator.schedule(key, airingAt - REVALIDATE_BEFORE, payload)
+
+
+async def announce(self, key, release):
+    """Scheduler callback, everything is prepared so just send it to every
+    guild watching it at once."""
+    # Channels aren't stored with the timer, guilds can subscribe or change
+    # their anime channel until it fires
+    channels = []
+    for guild_id, watchlist in self.watchlists.items():
+        if release["id"] not in watchlist:
+            continue
+        channel = self.bot.get_channel(
+            self.bot.config.get(guild_id, {}).get("anime_ch")
+        )
+        if channel is not None:
+            channels.append(channel)
+    if not channels:
+        self.logger.warning(
+            f"{release['title']} ({release['id']}) has no channel to announce to."
+        )
+        return
+
+    embed = discord.Embed.from_dict(release["embed"])
+    start = time.monotonic()
+    results = await asyncio.gather(
+        *[channel.send(embed=embed) for channel in channels], return_exceptions=True
+    )
+    # Measured once everything is sent, send latency is part of the skew
+    skew = time.time() - release["airingAt"]
+    failed = 0
+    for channel, result in zip(channels, results):
+        if isinstance(result, Exception):
+            failed += 1
+            self.logger.warning(
+                f"Couldn't announce {release['title']} in {channel.guild}"
+                + f" #{channel}: {result!r}"
+            )
+    self.logger.info(
+        f"Announced {release['title']} episode {release['episode']} to"
+        + f" {len(channels) - failed}/{len(channels)} channels"
+        + f" (skew {skew:+.2f}s, took {time.monotonic() - start:.2f}s)"
+    )
 
 
 async def find_with_name(self, ctx, anime, _type_):
     if not _type_:
         q = await query(
+            self,
             "query($name:String){Media(search:$name,type:ANIME){id,"
-            + "title {romaji,english}, coverImage {large}, status, episodes, averageScore, seasonYear  } }",
+            + "title {romaji,english}, synonyms, format, coverImage {large}, status, episodes, averageScore, seasonYear  } }",
             {"name": anime},
+            cache="anime",
         )
     else:
         _type_ = str(_type_.upper())
         q = await query(
+            self,
             "query($name:String,$atype:MediaFormat){Media(search:$name,type:ANIME,format:$atype){id,"
-            + "title {romaji,english}, coverImage {large}, status, episodes, averageScore, seasonYear  } }",
+            + "title {romaji,english}, synonyms, format, coverImage {large}, status, episodes, averageScore, seasonYear  } }",
             {"name": anime, "atype": _type_},
+            cache="anime",
         )
     try:
+        # So the next time this name resolves without asking AniList
+        self.titles.add(q["data"]["Media"])
         return q["data"]
     except TypeError:
         if not _type_:
@@ -316,18 +583,26 @@ async def find_id(self, ctx, url, _type_: str = None):
     # if MAL link get the id, find AL id out of MAL id then return the AL id
     match = re.search(regexMAL, url)
     if not match:
+        _id_ = self.titles.match(url, _type_)
+        if _id_:
+            return _id_
         _id_ = await find_with_name(self, ctx, url, _type_)
         return int(_id_["Media"]["id"])
 
-    # getting ID from MAL ID
+    # getting ID from MAL ID, only ask AniList the first time
+    _id_ = self.mal_ids.get(match.group(1))
+    if _id_:
+        return _id_
     q = await query(
-        "query($malId: Int){Media(idMal:$malId){id}}", {"malId": match.group(1)}
+        self,
+        "query($malId: Int){Media(idMal:$malId){id}}",
+        {"malId": match.group(1)},
     )
     if q is None:
-        print("Error")
-        await ctx.send(f"Anime with id **{url}** can't be found.")
         return None
-    return int(q["data"]["Media"]["id"])
+    _id_ = int(q["data"]["Media"]["id"])
+    self.mal_ids.add(match.group(1), _id_)
+    return _id_
 
 
 async def getinfo(self, ctx, other, _format_: str = None):
@@ -335,12 +610,29 @@ async def getinfo(self, ctx, other, _format_: str = None):
     if not mediaId:
         raise IdNotFound
 
-    a = await query(generalQ, {"mediaId": mediaId})
-    if not a:
+    media = await get_media(self, mediaId)
+    if not media:
         raise IdNotFound
 
-    a = a["data"]
-    return a
+    return {"Media": media}
+
+
+async def find_media(self, ctx, anime, _format_: str = None):
+    """Media `anime` refers to, None once the user got told it wasn't found."""
+    try:
+        return (await getinfo(self, ctx, anime, _format_))["Media"]
+    except (NameNotFound, NameTypeNotFound, IdNotFound):
+        embed = discord.Embed(
+            title="404",
+            description=f"Couldn't find **{anime}**",
+            colour=discord.Colour(0x02A9FF),
+        )
+        embed.set_author(
+            name="AniList",
+            icon_url="https://gblobscdn.gitbook.com/spaces%2F-LHizcWWtVphqU90YAXO%2Favatar.png",
+        )
+        await ctx.send(embed=embed)
+        return None
 
 
 async def send_info(self, ctx, other, _format_: str = None):
@@ -464,13 +756,61 @@ async def send_info(self, ctx, other, _format_: str = None):
     return
 
 
-async def search_ani_new(self, ctx, anime, page):
-    q = await query(searchAni, {"name": anime, "page": page, "amount": 1})
+async def search_ani_new(self, ctx, anime, page, amount=1):
+    q = await query(self, searchAni, {"name": anime, "page": page, "amount": amount})
     if q:
+        # Results usually get looked up with `anime info` next
+        for media in q["data"]["Page"]["media"]:
+            remember_media(self, media)
         return q["data"]
     return
 
 
+class SearchResults:
+    """Results of one `anime search`, fetched `per_chunk` at a time.
+
+    Whenever a chunk is used the next one is already fetched in the
+    background, so flipping pages rarely has to wait for AniList."""
+
+    def __init__(self, cog, ctx, anime, per_chunk=10):
+        self.cog = cog
+        self.ctx = ctx
+        self.anime = anime
+        self.per_chunk = per_chunk
+        self.total = 0
+        self.chunks = {}
+
+    def _chunk(self, number):
+        task = self.chunks.get(number)
+        if task is None:
+            task = self.chunks[number] = asyncio.ensure_future(
+                search_ani_new(self.cog, self.ctx, self.anime, number, self.per_chunk)
+            )
+        return task
+
+    async def get(self, page):
+        """Return the media on `page` (1 result per page) or None."""
+        number, index = divmod(page - 1, self.per_chunk)
+        data = await self._chunk(number + 1)
+        if not data:
+            return None
+        info = data["Page"]["pageInfo"]
+        self.total = info["total"]
+        if info["hasNextPage"]:
+            self._chunk(number + 2)
+        media = data["Page"]["media"]
+        return media[index] if index < len(media) else None
+
+    def close(self):
+        for task in self.chunks.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Nobody might ever look at a failed prefetch
+                task.exception()
+        self.chunks.clear()
+
+
 # async def createAnnoucementEmbed(entry: str=None, date: str=None, upNext: str=None):
 
 
@@ -480,24 +820,81 @@ class AniList(commands.Cog):
         self.handle_schedule.start()
         self.logger = logging.getLogger("discord")
 
-        checkjson()
-
-        with open("data/anime.json") as f:
-            try:
-                self.watchlist = json.load(f)["watchlist"]
-            except json.decoder.JSONDecodeError:
-                self.watchlist = []
+        # guild id: [media id], only guilds on our shards
+        self.watchlists = self.bot.storage.load_watchlists(
+            self.bot.shard_ids, self.bot.shard_count
+        )
+        # AniList allows 90 requests per minute
+        self.governor = RateGovernor(90, 60)
+        # Media lookups from every command are batched into one request
+        self.media = DataLoader(lambda ids: fetch_media(self, ids))
+        # Persisted, by far most lookups are for shows that finished airing
+        self.media_cache = MediaCache(self.bot.storage)
+        # Resolves names we've seen before without a search request
+        self.titles = TitleIndex(self.bot.storage)
+        for _, media in self.media_cache.entries.values():
+            self.titles.add(media)
+        # MyAnimeList -> AniList ids, warm it with `python3 -m utilities.idmap`
+        self.mal_ids = IdMap(self.bot.storage)
+        # Background work started by commands, referenced until it's done
+        self.tasks = set()
+        # Pending announcements, survives restarts. Clusters share the SQLite
+        # database, each keeps its own timers for the guilds on its shards
+        shards = self.bot.shard_ids or []
+        namespace = "anilist"
+        if shards and len(shards) < (self.bot.shard_count or 1):
+            namespace += f"-shards-{min(shards)}-{max(shards)}"
+        self.scheduler = Scheduler(
+            self.bot.storage, namespace, lambda key, r: announce(self, key, r)
+        )
+        self.revalidator = Scheduler(
+            self.bot.storage,
+            f"{namespace}-revalidate",
+            lambda key, p: revalidate(self, key, p),
+        )
 
     def cog_unload(self):
         self.handle_schedule.cancel()
+        self.scheduler.stop()
+        self.revalidator.stop()
+        for task in self.tasks:
+            task.cancel()
+
+    def is_mod():
+        def predicate(ctx):
+            return ctx.author.guild_permissions.manage_channels
+
+        return commands.check(predicate)
 
-    async def is_mainserver(ctx):
-        return ctx.guild.id == 645074407244562444
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        for media_id in self.watchlists.pop(str(guild.id), []):
+            self.bot.storage.remove_watchlist(guild.id, media_id)
 
     @tasks.loop(hours=24)
     async def handle_schedule(self):
         self.logger.warning("Checking for new releases on AniList...")
-        await getschedule(self, int(time.time() + (24 * 60 * 60 * 1000 * 1) / 1000), 1)
+        # Retry failed refreshes soon, waiting a day would miss releases
+        while True:
+            try:
+                # An hour of overlap so nothing slips between two refreshes
+                _time_ = int(time.time() + 25 * 60 * 60)
+                if await getschedule(self, _time_) is not None:
+                    return
+            except Exception:
+                self.logger.exception("Refreshing the AniList schedule failed:")
+            self.logger.warning(
+                f"Retrying the AniList schedule in {SCHEDULE_RETRY // 60} minutes"
+            )
+            await asyncio.sleep(SCHEDULE_RETRY)
+
+    @handle_schedule.before_loop
+    async def before_handle_schedule(self):
+        # Cogs are loaded before the bot connects now
+        await self.bot.wait_until_ready()
+        # Fires whatever came due while we were offline
+        self.scheduler.start()
+        self.revalidator.start()
 
     @commands.group(brief="Get information about anime from AniList.")
     async def anime(self, ctx):
@@ -533,9 +930,8 @@ class AniList(commands.Cog):
             else:
                 return False
 
-        def create_embed(ctx, data, pageData):
+        def create_embed(ctx, data, page, total):
             embed = None
-            data = data["media"][0]
             rating = data["averageScore"] or 0
             if rating >= 90:
                 ratingEmoji = "😃"
@@ -554,7 +950,7 @@ class AniList(commands.Cog):
             )
             embed.set_author(
                 name=f"AniList - "
-                + f"Page {pageData['currentPage']}/{pageData['lastPage']} - "
+                + f"Page {page}/{total} - "
                 + f"{ratingEmoji} {rating}%",
                 icon_url="https://gblobscdn.gitbook.com/spaces%2F-LHizcWWtVphqU90YAXO%2Favatar.png",
             )
@@ -599,69 +995,124 @@ class AniList(commands.Cog):
             embed.add_field(name="Genres", value=genres or "Unknown", inline=False)
             return embed
 
-        q = await search_ani_new(self, ctx, anime, 1)
-        if not q:
-            await ctx.send(f"No anime with keyword '{anime}' not found.")
-            return
-        e = create_embed(ctx, q["Page"], q["Page"]["pageInfo"])
-        msg = await ctx.send(embed=e)
-        for emoji in embed_reactions:
-            await msg.add_reaction(emoji)
+        results = SearchResults(self, ctx, anime)
+        # Rendered pages, flipping back and forth doesn't rebuild anything
+        embeds = {}
 
-        while True:
-            try:
-                reaction, user = await self.bot.wait_for(
-                    "reaction_add", check=check_reactions, timeout=60.0
-                )
-            except asyncio.TimeoutError:
-                break
-            else:
-                emoji = check_reactions(reaction, user)
+        async def get_embed(page):
+            if page not in embeds:
+                data = await results.get(page)
+                if not data:
+                    return None
+                embeds[page] = create_embed(ctx, data, page, results.total)
+            return embeds[page]
+
+        try:
+            e = await get_embed(page)
+            if not e:
+                await ctx.send(f"No anime with keyword '{anime}' not found.")
+                return
+            msg = await ctx.send(embed=e)
+            for emoji in embed_reactions:
+                await msg.add_reaction(emoji)
+
+            while True:
                 try:
-                    await msg.remove_reaction(reaction.emoji, user)
-                except discord.Forbidden:
-                    pass
-                if emoji == "◀️" and page != 1:
-                    page -= 1
-                    q = await search_ani_new(self, ctx, anime, page)
-                    if not q:
-                        pass
-                    e = create_embed(ctx, q["Page"], q["Page"]["pageInfo"])
-                    await msg.edit(embed=e)
-                if emoji == "▶️" and q["Page"]["pageInfo"]["hasNextPage"]:
-                    page += 1
-                    q = await search_ani_new(self, ctx, anime, page)
-                    if not q:
-                        pass
-                    e = create_embed(ctx, q["Page"], q["Page"]["pageInfo"])
-                    await msg.edit(embed=e)
-                if emoji == "⏹️":
-                    # await msg.clear_reactions()
+                    reaction, user = await self.bot.wait_for(
+                        "reaction_add", check=check_reactions, timeout=60.0
+                    )
+                except asyncio.TimeoutError:
                     break
+                else:
+                    emoji = check_reactions(reaction, user)
+                    try:
+                        await msg.remove_reaction(reaction.emoji, user)
+                    except discord.Forbidden:
+                        pass
+                    if emoji == "◀️" and page != 1:
+                        e = await get_embed(page - 1)
+                        if e:
+                            page -= 1
+                            await msg.edit(embed=e)
+                    if emoji == "▶️" and page < results.total:
+                        e = await get_embed(page + 1)
+                        if e:
+                            page += 1
+                            await msg.edit(embed=e)
+                    if emoji == "⏹️":
+                        # await msg.clear_reactions()
+                        break
+        finally:
+            results.close()
+            embeds.clear()
 
         return
 
+    @anime.command(aliases=["timers"])
+    async def upcoming(self, ctx):
+        """Show scheduled release announcements."""
+        embed = discord.Embed(
+            title="Upcoming Releases", colour=discord.Colour(0x02A9FF)
+        )
+        embed.set_author(
+            name="AniList",
+            icon_url="https://gblobscdn.gitbook.com/spaces%2F-LHizcWWtVphqU90YAXO%2Favatar.png",
+        )
+        jakarta = timezone("Asia/Jakarta")
+        watchlist = self.watchlists.get(str(ctx.guild.id), []) if ctx.guild else []
+        pending = [p for p in self.scheduler.pending() if p[2]["id"] in watchlist]
+        for due, key, release in pending[:25]:
+            _time_ = datetime.datetime.fromtimestamp(due, tz=jakarta).strftime(
+                "%d %b %Y - %H:%M WIB"
+            )
+            _timeTillAired_ = datetime.timedelta(
+                seconds=max(0, int(due - time.time()))
+            )
+            embed.add_field(
+                name=f"{release['title']} ({release['id']})",
+                value=f"Episode {release['episode']} at **{_time_}**"
+                + f" (**{_timeTillAired_}**)",
+                inline=False,
+            )
+        if not pending:
+            embed.description = "Nothing is scheduled."
+        elif len(pending) > 25:
+            embed.set_footer(text=f"and {len(pending) - 25} more")
+        await ctx.send(embed=embed)
+
     @anime.command(usage="(anime) [format]")
-    @commands.check(is_mainserver)
+    @commands.guild_only()
+    @is_mod()
     async def watch(self, ctx, anime, _format: str = None):
         """Add anime to watchlist."""
         if not anime:
             return
-        _id_ = await find_id(self, ctx, anime, _format)
-
-        # Get info from API
-        q = await getinfo(self, ctx, anime, _format)
+        media = await find_media(self, ctx, anime, _format)
+        if media is None:
+            return
 
-        title = q["Media"]["title"]["romaji"]
-        if _id_ not in self.watchlist:
-            self.watchlist.append(_id_)
-            with open("data/anime.json", "w") as f:
-                json.dump({"watchlist": self.watchlist}, f, indent=4)
+        _id_ = media["id"]
+        title = media["title"]["romaji"]
+        watchlist = self.watchlists.setdefault(str(ctx.guild.id), [])
+        if _id_ not in watchlist:
+            new = _id_ not in watched(self)
+            watchlist.append(_id_)
+            self.bot.storage.add_watchlist(ctx.guild.id, _id_)
+            if new:
+                # Don't wait for the next daily refresh, only fetch this one
+                task = self.bot.loop.create_task(schedule_media(self, _id_))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
             embed = discord.Embed(
                 title="New anime just added!",
                 description=f"**{title}** ({_id_}) has been added to the watchlist!",
                 colour=discord.Colour(0x02A9FF),
             )
+            if not self.bot.config.get(str(ctx.guild.id), {}).get("anime_ch"):
+                embed.set_footer(
+                    text="No announcement channel yet, set one with "
+                    + f"{ctx.prefix}channel set (channel id) anime"
+                )
         else:
             embed = discord.Embed(
                 title="Failed to add anime!",
@@ -672,26 +1123,29 @@ class AniList(commands.Cog):
             name="AniList",
             icon_url="https://gblobscdn.gitbook.com/spaces%2F-LHizcWWtVphqU90YAXO%2Favatar.png",
         )
-        embed.set_thumbnail(url=q["Media"]["coverImage"]["large"])
+        embed.set_thumbnail(url=media["coverImage"]["large"])
         await ctx.send(embed=embed)
         return
 
     @anime.command(usage="(anime) [format]")
-    @commands.check(is_mainserver)
+    @commands.guild_only()
+    @is_mod()
     async def unwatch(self, ctx, anime, _format: str = None):
         """Remove anime to watchlist."""
         if not anime:
             return
-        _id_ = await find_id(self, ctx, anime)
-
-        # Get info from API
-        q = await getinfo(self, ctx, anime, _format)
+        media = await find_media(self, ctx, anime, _format)
+        if media is None:
+            return
 
-        title = q["Media"]["title"]["romaji"]
-        if _id_ in self.watchlist:
-            self.watchlist.remove(_id_)
-            with open("data/anime.json", "w") as f:
-                json.dump({"watchlist": self.watchlist}, f, indent=4)
+        _id_ = media["id"]
+        title = media["title"]["romaji"]
+        watchlist = self.watchlists.get(str(ctx.guild.id), [])
+        if _id_ in watchlist:
+            watchlist.remove(_id_)
+            if not watchlist:
+                del self.watchlists[str(ctx.guild.id)]
+            self.bot.storage.remove_watchlist(ctx.guild.id, _id_)
             embed = discord.Embed(
                 title="An anime just removed!",
                 description=f"**{title}** ({_id_}) has been removed from the watchlist!",
@@ -703,17 +1157,16 @@ class AniList(commands.Cog):
                 description=f"**{title}** ({_id_}) is not in the watchlist!",
                 colour=discord.Colour(0x02A9FF),
             )
-        await ctx.send(f"**{title}** ({_id_}) has been removed from the watchlist")
         embed.set_author(
             name="AniList",
             icon_url="https://gblobscdn.gitbook.com/spaces%2F-LHizcWWtVphqU90YAXO%2Favatar.png",
         )
-        embed.set_thumbnail(url=q["Media"]["coverImage"]["large"])
+        embed.set_thumbnail(url=media["coverImage"]["large"])
         await ctx.send(embed=embed)
         return
 
     @anime.command(aliases=["wl", "list"])
-    @commands.check(is_mainserver)
+    @commands.guild_only()
     async def watchlist(self, ctx):
         """Get list of anime that added to watchlist."""
         await getwatchlist(self, ctx)
@@ -16,3 +16,7 @@ class IdNotFound(Error):
 
 class NoResultFound(Error):
     pass
+
+
+class AniListUnavailable(Error):
+    pass
@@ -0,0 +1,6 @@
+class Error(Exception):
+    pass
+
+
+class RunsUnavailable(Error):
+    pass
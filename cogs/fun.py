@@ -1,9 +1,7 @@
 import asyncio
 import datetime
 import discord
-import json
 import os
-import praw
 import re
 
 from cogs.errors.fun import DiceTooBig
@@ -12,6 +10,9 @@ from discord.errors import Forbidden
 from dotenv import load_dotenv
 from random import choice, randint
 from typing import Optional
+from utilities.startup import Lazy, lazy_import
+
+praw = lazy_import("praw")
 
 try:
     REDDIT_CLIENT_ID = os.environ["REDDIT_CLIENT_ID"]
@@ -31,10 +32,13 @@ except:
     load_dotenv()
     REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT")
 
-reddit = praw.Reddit(
-    client_id=REDDIT_CLIENT_ID,
-    client_secret=REDDIT_CLIENT_SECRET,
-    user_agent=REDDIT_USER_AGENT,
+reddit = Lazy(
+    lambda: praw.Reddit(
+        client_id=REDDIT_CLIENT_ID,
+        client_secret=REDDIT_CLIENT_SECRET,
+        user_agent=REDDIT_USER_AGENT,
+    ),
+    "praw.Reddit",
 )
 
 
@@ -373,10 +377,10 @@ class Fun(commands.Cog):
     @commands.command(aliases=["badjokes"])
     async def dadjokes(self, ctx):
         headers = {"accept": "application/json"}
-        async with self.bot.session.get(
-            "https://icanhazdadjoke.com/", headers=headers
-        ) as req:
-            dadjoke = json.loads(await req.text())["joke"]
+        req = await self.bot.session.get(
+            "https://icanhazdadjoke.com/", headers=headers, cache="dadjoke"
+        )
+        dadjoke = req.json()["joke"]
         e = discord.Embed(title=dadjoke, color=discord.Colour(0xFEDE58))
         e.set_author(
             name="icanhazdadjoke",
@@ -1,9 +1,7 @@
-import aiohttp
 import asyncio
 import bot
 import datetime
 import discord
-import epicstore_api
 import json
 import logging
 import os
@@ -20,6 +18,9 @@ from discord.ext import commands
 from dotenv import load_dotenv
 from pytz import timezone
 from typing import Optional
+from utilities.startup import Lazy, lazy_import
+
+epicstore_api = lazy_import("epicstore_api")
 
 try:
     WEATHER_API = os.environ["WEATHER_API"]
@@ -27,8 +28,7 @@ except:
     load_dotenv()
     WEATHER_API = os.getenv("WEATHER_API")
 
-egs = epicstore_api.EpicGamesStoreAPI()
-session = aiohttp.ClientSession()
+egs = Lazy(lambda: epicstore_api.EpicGamesStoreAPI(), "EpicGamesStoreAPI")
 
 MORSE_CODE_DICT = {
     "A": ".-",
@@ -123,15 +123,14 @@ def temperature(temp, unit: str, number_only=False):
     return f"{round(temp)}°{unit.upper()}"
 
 
-async def weather_get(*place, _type="city"):
+async def weather_get(self, *place, _type="city"):
     place = " ".join([*place])
     if _type == "city":
         q = "q"
     elif _type == "zip":
         q = "zip"
     apilink = f"https://api.openweathermap.org/data/2.5/weather?{q}={place}&appid={WEATHER_API}"
-    async with session.get(apilink) as url:
-        weatherData = json.loads(await url.text())
+    weatherData = (await self.bot.session.get(apilink, cache="weather")).json()
     if weatherData["cod"] == "404":
         raise CityNotFound
     return weatherData
@@ -194,39 +193,37 @@ class General(commands.Cog):
         body = {"compiler": compiler, "code": code, "save": True}
         head = {"Content-Type": "application/json"}
         async with ctx.typing():
-            async with self.bot.session.post(
+            r = await self.bot.session.post(
                 "https://wandbox.org/api/compile.json",
                 headers=head,
                 data=json.dumps(body),
-            ) as r:
-                # r = requests.post("https://wandbox.org/api/compile.json", headers=head, data=json.dumps(body))
-                try:
-                    response = json.loads(await r.text())
-                    # await ctx.send(f"```json\n{json.dumps(response, indent=4)}```")
-                    self.logger.info(f"json\n{json.dumps(response, indent=4)}")
-                except json.decoder.JSONDecodeError:
-                    self.logger.error(f"json\n{r.text}")
-                    await ctx.send(f"```json\n{r.text}```")
+            )
+            try:
+                response = r.json()
+                # await ctx.send(f"```json\n{json.dumps(response, indent=4)}```")
+                self.logger.info(f"json\n{json.dumps(response, indent=4)}")
+            except json.decoder.JSONDecodeError:
+                self.logger.error(f"json\n{r.text}")
+                await ctx.send(f"```json\n{r.text}```")
+                return
 
-                try:
-                    embed = discord.Embed(title="Compiled code")
-                    embed.add_field(
-                        name="Output",
-                        value=f'```{response["program_message"]}```',
-                        inline=False,
-                    )
-                    embed.add_field(
-                        name="Exit code", value=response["status"], inline=True
-                    )
-                    embed.add_field(
-                        name="Link",
-                        value=f"[Permalink]({response['url']})",
-                        inline=True,
-                    )
-                    await ctx.send(embed=embed)
-                except KeyError:
-                    self.logger.error(f"json\n{json.dumps(response, indent=4)}")
-                    await ctx.send(f"```json\n{json.dumps(response, indent=4)}```")
+            try:
+                embed = discord.Embed(title="Compiled code")
+                embed.add_field(
+                    name="Output",
+                    value=f'```{response["program_message"]}```',
+                    inline=False,
+                )
+                embed.add_field(name="Exit code", value=response["status"], inline=True)
+                embed.add_field(
+                    name="Link",
+                    value=f"[Permalink]({response['url']})",
+                    inline=True,
+                )
+                await ctx.send(embed=embed)
+            except KeyError:
+                self.logger.error(f"json\n{json.dumps(response, indent=4)}")
+                await ctx.send(f"```json\n{json.dumps(response, indent=4)}```")
 
     @commands.command()
     async def source(self, ctx):
@@ -523,8 +520,8 @@ class General(commands.Cog):
     async def xboxinfo(self, ctx, gamertag):
         """Show user's xbox information."""
         xbox = "https://xbl-api.prouser123.me/profile/gamertag"
-        async with session.get(f"{xbox}/{gamertag}") as url:
-            xboxdata = json.loads(await url.text())["profileUsers"][0]["settings"]
+        url = await self.bot.session.get(f"{xbox}/{gamertag}", cache="xbox")
+        xboxdata = url.json()["profileUsers"][0]["settings"]
         if not xboxdata:
             return
 
@@ -562,8 +559,9 @@ class General(commands.Cog):
         if country.lower() in ["united kingdom"]:
             country = "UK"
         api = "https://api.covid19api.com/total/country"
-        async with session.get(f"{api}/{country}") as url:
-            covData = json.loads(await url.text())
+        covData = (
+            await self.bot.session.get(f"{api}/{country}", cache="covid")
+        ).json()
         try:
             covData = covData[len(covData) - 1]
         except KeyError:
@@ -583,7 +581,7 @@ class General(commands.Cog):
     async def weather(self, ctx, *city):
         """Show weather report."""
         try:
-            weatherData = await weather_get(*city, _type="city")
+            weatherData = await weather_get(self, *city, _type="city")
         except CityNotFound:
             await ctx.send("City not found")
             return
@@ -614,7 +612,7 @@ class General(commands.Cog):
     async def weather_city(self, ctx, *city):
         """Show weather report from a city."""
         try:
-            weatherData = await weather_get(*city, _type="city")
+            weatherData = await weather_get(self, *city, _type="city")
         except CityNotFound:
             await ctx.send("City not found")
             return
@@ -645,7 +643,7 @@ class General(commands.Cog):
     async def weather_zip(self, ctx, *city):
         """Show weather report from a zip code."""
         try:
-            weatherData = await weather_get(*city, _type="zip")
+            weatherData = await weather_get(self, *city, _type="zip")
         except CityNotFound:
             await ctx.send("City not found")
             return
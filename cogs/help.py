@@ -1,7 +1,6 @@
 import asyncio
 import bot
 import discord
-import json
 import logging
 
 from bot import get_prefix
@@ -13,8 +12,8 @@ class CustomHelp(commands.HelpCommand):
     COLOUR = discord.Colour.blue()
 
     def get_desc(self):
-        with open("data/guild.json", "r") as f:
-            prefixes = json.load(f)[str(self.get_destination().guild.id)]["prefix"]
+        bot = self.context.bot
+        prefixes = bot.config[str(self.get_destination().guild.id)]["prefix"]
         if len(prefixes) > 1:
             s = "are"
         else:
@@ -154,11 +153,8 @@ class Help(commands.Cog):
     async def listcommands(self, ctx):
         """List all custom commands."""
         embed = discord.Embed(title="Help", colour=discord.Colour.gold())
-        with open("data/custom_commands.json", "r") as f:
-            commands = json.load(f)
-            ccmds = ", ".join([*commands[str(ctx.guild.id)]])
-            # await ctx.send(f"```List of custom commands: \n{ccmds}```")
-            # output += f'{ccmds}```'
+        commands = self.bot.custom_commands.get(str(ctx.guild.id), {})
+        ccmds = ", ".join([*commands]) or "No custom commands."
         embed.add_field(name="Custom Commands", value=f"{ccmds}", inline=False)
         await ctx.send(embed=embed)
 
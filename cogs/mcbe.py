@@ -1,209 +1,446 @@
-import aiohttp
 import asyncio
+import datetime
 import dateutil.parser
 import discord
-import json
-import requests
+import logging
+import time
 
+from cogs.errors.mcbe import RunsUnavailable
+from collections import Counter
 from discord.ext import commands, tasks
 from discord.utils import get
-from utilities.formatting import pformat, realtime
+from utilities.formatting import realtime
+from utilities.speedrun import SRC_API, SpeedrunMeta
+from utilities.webhooks import EMBEDS_PER_MESSAGE
 
-session = aiohttp.ClientSession()
+MCBE_ID = "yd4ovvg1"
+GAMES = [MCBE_ID, "v1po7r76"]  # [MCBE, MCBECE Game ID]
+PENDING_CHANNEL = 741199490391736340
+# Stats message in the posted messages map, run ids never look like this
+STATS_KEY = "stats"
 
 
-def checklevel(cat):
-    status = json.loads(
-        requests.get(
-            f"https://www.speedrun.com/api/v1/leaderboards/yd4ovvg1/category/{cat}"
-        ).text
+def playername(player):
+    # From mcbeDiscordBot (Steve) by MangoMan, guests only have a plain name
+    if player["rel"] == "user":
+        return player["names"]["international"]
+    return player["name"]
+
+
+async def leaderboard(self, path, **kwargs):
+    """Leaderboard data, raises RunsUnavailable if speedrun.com didn't give it."""
+    url = f"{SRC_API}/leaderboards/{MCBE_ID}/{path}"
+    resp = await self.bot.session.get(
+        url, headers={"Accept": "application/json"}, **kwargs
     )
+    if resp.status != 200:
+        raise RunsUnavailable(f"{resp.status} from {url}")
     try:
-        if status["status"] == 404:
-            return True
-    except KeyError:
-        return False
+        return resp.json()["data"]
+    except (ValueError, KeyError) as e:
+        raise RunsUnavailable(f"Unexpected response from {url}") from e
+
+
+async def platformrecord(self, path, seed_typeID, platform):
+    """Fastest run of one platform with its runners, in a single request."""
+    wr = await leaderboard(
+        self,
+        f"{path}?top=1&embed=players"
+        + f"&var-5ly7759l={seed_typeID}&var-38dj2ex8={platform}",
+        cache="speedrun",
+    )
+    runs = wr["runs"]
+    if not runs:
+        return None
+    run = runs[0]["run"]
+    players = wr["players"]["data"]
+    # Leaderboard players are embedded once for every run, match them by id
+    users = {p["id"]: p for p in players if p["rel"] == "user"}
+    runners = []
+    for player in run["players"]:
+        if player["rel"] == "user" and player["id"] in users:
+            runners.append(playername(users[player["id"]]))
+        elif player["rel"] == "guest":
+            runners.append(player["name"])
+    return ", ".join(runners), run["weblink"], realtime(run["times"]["realtime_t"])
 
 
 async def worldrecord(self, ctx, category: str = "", seed_type: str = ""):
-    head = {"Accept": "application/json", "User-Agent": "ziBot/0.1"}
-    game = "mcbe"
-
-    # Text formating (e.g. Any% Glitchless -> any_glitchless)
-    seed_type = pformat(seed_type)
-    cat = pformat(category)
-
-    # Get seed type
-    seed_typeID = None
-    async with session.get(
-        f"https://www.speedrun.com/api/v1/variables/5ly7759l"
-    ) as url:
-        sTypeVar = json.loads(await url.text())["data"]["values"]["values"]
-        for _type in sTypeVar:
-            if pformat(sTypeVar[_type]["label"]) == seed_type:
-                seed_typeID = _type
+    start = time.perf_counter()
+
+    # Names are resolved locally, only a fresh install has to fetch them
+    await self.meta.ensure()
+    try:
+        sTypeVar = self.meta.variables["5ly7759l"]["values"]["values"]
+        platforms = self.meta.variables["38dj2ex8"]["values"]["values"]
+    except KeyError:
+        await ctx.send("Can't reach speedrun.com, please try again later.")
+        return
+
+    # Get seed type (e.g. Set Seed -> set_seed)
+    seed_typeID = self.meta.value("5ly7759l", seed_type)
     if not seed_typeID:
         await ctx.send("Seed type not found, please try again")
         return
 
-    # Output formating
-    wrs = {"cat": "", "platform": "", "runner": "", "link": "", "time": ""}
-
-    # Get platforms name
-    platformsVar = json.loads(
-        requests.get(
-            f"https://www.speedrun.com/api/v1/variables/38dj2ex8", headers=head
-        ).text
-    )
-    platforms = platformsVar["data"]["values"]["values"]
-
-    # Check if ILs
-    level = checklevel(cat)
-    if level is True:
-        _type_ = "level"
-        catURL = f"{cat}/9kv7jy8k"
+    # Full game category, otherwise check if ILs
+    cat = self.meta.category(MCBE_ID, category)
+    level = self.meta.level(MCBE_ID, category)
+    if cat:
+        path = f"category/{cat['id']}"
+        catName = cat["name"]
+    elif level:
+        path = f"level/{level['id']}/9kv7jy8k"
+        catName = f"{level['name']} Any%"
     else:
-        _type_ = "category"
-        catURL = cat
-    async with session.get(
-        "https://www.speedrun.com/api/v1/leaderboards/yd4ovvg1/"
-        + f"{_type_}/{catURL}?embed={_type_}"
-    ) as url:
-        try:
-            catName = json.loads(await url.text())["data"][f"{_type_}"]["data"]["name"]
-        except KeyError:
-            await ctx.send("Category not found, please try again.")
-        if level is True:
-            catName += " Any%"
-
-    # Grab and Put Category Name to embed title
-    wrs["cat"] = catName
+        await ctx.send("Category not found, please try again.")
+        return
+
     embed = discord.Embed(title=f"World Records", colour=discord.Colour.gold())
 
-    # Get WRs from each platforms (PC, Mobile, Console) then send to chat
-    for platform in platforms:
-        async with session.get(
-            "https://www.speedrun.com/api/v1/leaderboards/yd4ovvg1/"
-            + f"{_type_}/{catURL}?top=1"
-            + f"&var-5ly7759l={seed_typeID}&var-38dj2ex8={platform}"
-        ) as url:
-            wr = json.loads(await url.text())
-            async with session.get(
-                "https://www.speedrun.com/api/v1/runs/"
-                + f"{wr['data']['runs'][0]['run']['id']}"
-                + "?embed=players,level,platform"
-            ) as url:
-                wrData = json.loads(await url.text())["data"]
-        wrs["platform"] = platforms[platform]["label"]
-        if wrData["players"]["data"][0]["rel"] == "guest":
-            wrs["runner"] = wrData["players"]["data"][0]["names"]
+    # Get WRs from each platforms (PC, Mobile, Console) concurrently, one
+    # failing only leaves that platform out
+    records = await asyncio.gather(
+        *[platformrecord(self, path, seed_typeID, platform) for platform in platforms],
+        return_exceptions=True,
+    )
+    for platform, record in zip(platforms, records):
+        if isinstance(record, Exception):
+            self.logger.warning(
+                f"Fetching the {platforms[platform]['label']} world record failed:"
+                + f" {record!r}"
+            )
+            value = "Unavailable, please try again later"
+        elif record is None:
+            value = "No runs yet"
         else:
-            wrs["runner"] = wrData["players"]["data"][0]["names"]["international"]
-        wrs["link"] = wr["data"]["runs"][0]["run"]["weblink"]
-        wrs["time"] = realtime(wrData["times"]["realtime_t"])
+            runner, link, _time_ = record
+            value = f"{runner} (**[{_time_}]({link})**)"
         embed.add_field(
-            name=f"{wrs['platform']}",
-            value=f"{wrs['runner']} (**[{wrs['time']}]({wrs['link']})**)",
-            inline=False,
+            name=f"{platforms[platform]['label']}", value=value, inline=False
         )
     embed.set_author(
-        name=f"MCBE - {wrs['cat']} - {sTypeVar[seed_typeID]['label']}",
+        name=f"MCBE - {catName} - {sTypeVar[seed_typeID]['label']}",
         icon_url="https://www.speedrun.com/themes/Default/1st.png",
     )
     embed.set_thumbnail(
         url="https://raw.githubusercontent.com/null2264/null2264/master/assets/mcbe.png"
     )
+    embed.set_footer(text=f"Fetched in {time.perf_counter() - start:.2f}s")
     await ctx.send(embed=embed)
 
 
-async def pendingrun(self, ctx):
-    # From mcbeDiscordBot (Steve) by MangoMan
-    def getnames(player):
-        if player["rel"] == "user":
-            return player["names"]["international"]
-        else:
-            return player["name"]
+def runtype(run, idx):
+    """"Full Game Run", "Individual Level" or "Category Extension", `idx` is
+    the game's index in `GAMES`."""
+    # if its cat ext overwrite gameType
+    if idx == 1:
+        return "Category Extension"
+    if run["level"]["data"]:
+        return "Individual Level"
+    return "Full Game Run"
 
-    # Run Counts
-    mcbe = 0
-    mcbeils = 0
-    mcbece = 0
 
-    head = {"Accept": "application/json", "User-Agent": "ziBot/0.2"}
-    gameIds = ["yd4ovvg1", "v1po7r76"]  # [MCBE, MCBECE Game ID]
-
-    for idx, game in enumerate(gameIds):
-        async with session.get(
-            "https://www.speedrun.com/api/v1/runs?game="
-            + f"{game}&status=new&max=200&embed=category,players,level&orderby=submitted",
-            headers=head,
-        ) as url:
-            runs = json.loads(await url.text())
-        for run in runs["data"]:
-
-            # Get run's duration and link
-            duration = realtime(run["times"]["realtime_t"])
-            runLink = run["weblink"]
-
-            # Get runner(s) names (also from MangoMan)
-            if len(run["players"]["data"]) > 1:
-                runners = [getnames(player) for player in run["players"]["data"]]
-                runners = ", ".join(runners)
-            else:
-                runners = getnames(run["players"]["data"][0])
+def runembed(run, idx):
+    # Get run's duration and link
+    duration = realtime(run["times"]["realtime_t"])
+    runLink = run["weblink"]
 
-            # get run's type + get category name
-            if run["level"]["data"]:
-                cat = run["level"]["data"]["name"]
-                gameType = "Individual Level"
-            else:
-                cat = run["category"]["data"]["name"]
-                gameType = "Full Game Run"
-
-            # if its cat ext overwrite gameType
-            if idx == 1:
-                gameType = "Category Extension"
-
-            # count runs
-            if gameType == "Full Game Run":
-                mcbe += 1
-            elif gameType == "Individual Level":
-                mcbeils += 1
-            else:
-                mcbece += 1
+    # Get runner(s) names (also from MangoMan)
+    runners = ", ".join(playername(player) for player in run["players"]["data"])
+
+    # get category name
+    if run["level"]["data"]:
+        cat = run["level"]["data"]["name"]
+    else:
+        cat = run["category"]["data"]["name"]
 
-            submitted = dateutil.parser.isoparse(run["submitted"])
+    submitted = dateutil.parser.isoparse(run["submitted"])
+
+    return discord.Embed(
+        title=runtype(run, idx),
+        url=runLink,
+        description=f"{cat} in `{duration}` by **{runners}**",
+        color=16711680 + idx * 60,
+        timestamp=submitted,
+    )
 
-            embed = discord.Embed(
-                title=gameType,
-                url=runLink,
-                description=f"{cat} in `{duration}` by **{runners}**",
-                color=16711680 + idx * 60,
-                timestamp=submitted,
-            )
-            await self.bot.get_channel(741199490391736340).send(embed=embed)
+
+def statsembed(counts):
+    # Run Counts
+    mcbe = counts["Full Game Run"]
+    mcbeils = counts["Individual Level"]
+    mcbece = counts["Category Extension"]
 
     # Pending Run Stats
     total = mcbe + mcbece + mcbeils
-    embed_stats = discord.Embed(
+    return discord.Embed(
         title="Pending Run Stats",
         description=f"Full Game Runs: {mcbe}\nIndividual Level Runs: {mcbeils}\nCategory Extension Runs: {mcbece}\n**Total: {total}**",
-        color=16711680 + idx * 60,
+        color=16711680 + (len(GAMES) - 1) * 60,
     )
-    await self.bot.get_channel(741199490391736340).send(embed=embed_stats)
+
+
+async def pendingruns(self, games=GAMES, buffer=200):
+    """Yield (game index, run) of every pending run of `games`, oldest first
+    per game.
+
+    Every game is paged through concurrently following `pagination.links`
+    and runs are yielded as soon as their page arrives. At most `buffer`
+    runs wait to be processed, fetching pauses until they are, so memory
+    doesn't grow with the queue. Raises RunsUnavailable if any page
+    couldn't be fetched."""
+    head = {"Accept": "application/json", "User-Agent": "ziBot/0.2"}
+    queue = asyncio.Queue(maxsize=buffer)
+
+    async def produce(idx, game):
+        url = (
+            f"{SRC_API}/runs?game={game}&status=new&max=200"
+            + "&embed=category,players,level&orderby=submitted"
+        )
+        try:
+            while url:
+                resp = await self.bot.session.get(url, headers=head)
+                if resp.status != 200:
+                    raise RunsUnavailable(f"{resp.status} from {url}")
+                page = resp.json()
+                url = None
+                for link in page["pagination"]["links"]:
+                    if link["rel"] == "next":
+                        url = link["uri"]
+                for run in page["data"]:
+                    await queue.put((idx, run))
+        except Exception as e:
+            await queue.put((idx, e))
+        else:
+            # This game is done
+            await queue.put((idx, None))
+
+    producers = [asyncio.ensure_future(produce(i, g)) for i, g in enumerate(games)]
+    try:
+        remaining = len(producers)
+        while remaining:
+            idx, run = await queue.get()
+            if run is None:
+                remaining -= 1
+            elif isinstance(run, Exception):
+                raise RunsUnavailable(f"Fetching pending runs failed: {run}") from run
+            else:
+                yield idx, run
+    finally:
+        for producer in producers:
+            producer.cancel()
+
+
+async def deletemessages(channel, message_ids):
+    """Delete messages by id, in bulk where Discord allows it."""
+    # Bulk deletes only work on messages younger than 14 days
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=13)
+    recent = [i for i in message_ids if discord.utils.snowflake_time(i) > cutoff]
+    old = [i for i in message_ids if i not in recent]
+    for i in range(0, len(recent), 100):
+        chunk = recent[i : i + 100]
+        try:
+            await channel.delete_messages([discord.Object(id=m) for m in chunk])
+        except discord.HTTPException:
+            old += chunk
+    for message_id in old:
+        try:
+            await channel.get_partial_message(message_id).delete()
+        except discord.NotFound:
+            pass
+
+
+async def removeruns(self, channel, gone):
+    """Take the runs in `gone` out of the channel.
+
+    Messages left without runs are deleted, the others are edited to drop
+    just those embeds."""
+    gone = set(gone)
+    messages = {}
+    for run_id, message_id in self.posted.items():
+        if run_id != STATS_KEY:
+            messages.setdefault(message_id, []).append(run_id)
+
+    empty = []
+    repost = []
+    for message_id, runs in messages.items():
+        left = [r for r in runs if r in gone]
+        if not left:
+            continue
+        if len(left) == len(runs):
+            empty.append(message_id)
+            continue
+        try:
+            message = await channel.fetch_message(message_id)
+        except discord.NotFound:
+            # Already gone, the rest gets posted again next sync
+            repost += [r for r in runs if r not in gone]
+            continue
+        # Run links end with the run id
+        embeds = [e for e in message.embeds if not str(e.url).endswith(tuple(left))]
+        if not await self.bot.poster.edit(channel, message_id, embeds):
+            empty.append(message_id)
+            repost += [r for r in runs if r not in gone]
+    await deletemessages(channel, empty)
+
+    forget = list(gone) + repost
+    for run_id in forget:
+        self.posted.pop(run_id, None)
+    self.bot.storage.delete_pending_posts(forget)
+
+
+async def syncpending(self, progress=None):
+    """Bring the pending runs channel in line with speedrun.com's queue.
+
+    New runs are posted 10 per message while the queue is still being
+    fetched, runs that left the queue (verified or rejected) are taken out
+    and the stats are edited in place. `progress(posted)` is awaited after
+    every message."""
+    channel = self.bot.get_channel(PENDING_CHANNEL)
+    posted = self.posted
+    if channel is not None and not posted:
+        # Still has the old purge-and-repost feed
+        await channel.purge(limit=500)
+
+    counts = Counter()
+    seen = set()
+    batch = []
+    new = 0
+
+    async def flush():
+        nonlocal new
+        ids = await self.bot.poster.post(channel, [e for _, e in batch])
+        for (run_id, _), message_id in zip(batch, ids):
+            posted[run_id] = message_id
+            self.bot.storage.save_pending_post(run_id, message_id)
+        new += len(batch)
+        batch.clear()
+        if progress is not None:
+            await progress(new)
+
+    try:
+        async for idx, run in pendingruns(self):
+            # Pages shift while runs get verified, don't count one twice
+            if run["id"] in seen:
+                continue
+            seen.add(run["id"])
+            counts[runtype(run, idx)] += 1
+            if channel is not None and run["id"] not in posted:
+                batch.append((run["id"], runembed(run, idx)))
+                if len(batch) == EMBEDS_PER_MESSAGE:
+                    await flush()
+    except RunsUnavailable as e:
+        # Without the whole queue we can't tell which runs left it
+        self.logger.warning(str(e))
+        if batch:
+            await flush()
+        return
+    if batch:
+        await flush()
+    stats = statsembed(counts)
+    changed = self.stats is None or stats.to_dict() != self.stats.to_dict()
+    self.stats = stats
+    self.synced = time.time()
+    if channel is None:
+        # Lives on another cluster
+        return
+
+    gone = [r for r in posted if r != STATS_KEY and r not in seen]
+    if gone:
+        await removeruns(self, channel, gone)
+    if new or gone:
+        self.logger.info(f"Pending runs: {new} submitted, {len(gone)} left the queue")
+
+    if STATS_KEY in posted:
+        if not changed:
+            return
+        try:
+            await channel.get_partial_message(posted[STATS_KEY]).edit(embed=stats)
+            return
+        except discord.NotFound:
+            pass
+    message = await channel.send(embed=stats)
+    posted[STATS_KEY] = message.id
+    self.bot.storage.save_pending_post(STATS_KEY, message.id)
 
 
 # Cog commands
 class MCBE(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.logger = logging.getLogger("discord")
+        # Categories, levels and variables barely change, keep them around
+        self.meta = SpeedrunMeta(self.bot.storage, self.bot.session, [MCBE_ID])
+        self.refresh_meta.start()
+        # Run id: message id of everything in the pending runs channel
+        self.posted = self.bot.storage.load_pending_posts()
+        self.stats = None
+        self.synced = None
+        self.sync_lock = asyncio.Lock()
+        self.sync_pending.start()
+
+    def cog_unload(self):
+        self.refresh_meta.cancel()
+        self.sync_pending.cancel()
+
+    @tasks.loop(hours=12)
+    async def refresh_meta(self):
+        await self.meta.refresh()
+
+    @refresh_meta.before_loop
+    async def before_refresh_meta(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(minutes=5)
+    async def sync_pending(self):
+        if self.bot.get_channel(PENDING_CHANNEL) is None:
+            return
+        try:
+            async with self.sync_lock:
+                await syncpending(self)
+        except Exception as e:
+            # Keep polling, whatever got posted so far is already saved
+            self.logger.error(f"Syncing pending runs failed: {e!r}")
+
+    @sync_pending.before_loop
+    async def before_sync_pending(self):
+        await self.bot.wait_until_ready()
 
     @commands.command()
     async def pending(self, ctx):
         """Get MCBE pending runs from speedun.com."""
-        async with ctx.typing():
-            await self.bot.get_channel(741199490391736340).purge(limit=500)
-            await pendingrun(self, ctx)
+        # Kept up to date in the background, only sync if that's not running
+        status = None
+        if self.synced is None or time.time() - self.synced > 10 * 60:
+            status = await ctx.send("Syncing pending runs...")
+            last = time.monotonic()
+
+            async def progress(posted):
+                nonlocal last
+                # Don't spend the rate limit on progress updates
+                if time.monotonic() - last > 2:
+                    last = time.monotonic()
+                    await status.edit(
+                        content=f"Syncing pending runs... {posted} posted"
+                    )
+
+            async with self.sync_lock:
+                await syncpending(self, progress)
+        if self.stats is None:
+            text = "Can't reach speedrun.com, please try again later."
+            if status:
+                await status.edit(content=text)
+            else:
+                await ctx.send(text)
+            return
+        embed = self.stats.copy()
+        ago = datetime.timedelta(seconds=int(time.time() - self.synced))
+        embed.set_footer(text=f"Updated {ago} ago")
+        if status:
+            await status.edit(content=None, embed=embed)
+        else:
+            await ctx.send(embed=embed)
 
     @commands.command(
         aliases=["worldrecords"],
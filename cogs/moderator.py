@@ -3,8 +3,6 @@ import bot
 import copy
 import datetime
 import discord
-import git
-import json
 import logging
 import os
 import re
@@ -16,6 +14,9 @@ from bot import get_cogs, get_prefix
 from discord.errors import Forbidden
 from discord.ext import commands
 from utilities.formatting import realtime
+from utilities.startup import lazy_import, lazy_times
+
+git = lazy_import("git")
 
 SHELL = os.getenv("SHELL") or "/bin/bash"
 WINDOWS = sys.platform == "win32"
@@ -27,6 +28,7 @@ ch_types = {
     "purgatory": "purge_ch",
     "meme": "meme_ch",
     "pingme": "pingme_ch",
+    "anime": "anime_ch",
 }
 
 
@@ -315,9 +317,9 @@ class Admin(commands.Cog, name="Moderator"):
     @commands.check_any(is_mod(), is_botmaster())
     async def setcommand(self, ctx, command, *, message):
         """Add a new simple command."""
-        self.bot.custom_commands[str(ctx.guild.id)][ctx.prefix + command] = message
-        with open("data/custom_commands.json", "w") as f:
-            json.dump(self.bot.custom_commands, f, indent=4)
+        guild_commands = self.bot.custom_commands.setdefault(str(ctx.guild.id), {})
+        guild_commands[ctx.prefix + command] = message
+        self.bot.storage.save_custom_command(ctx.guild.id, ctx.prefix + command, message)
         embed = discord.Embed(
             title="New command has been added!", description=f"{ctx.prefix}{command}"
         )
@@ -328,8 +330,7 @@ class Admin(commands.Cog, name="Moderator"):
     async def removecommand(self, ctx, command):
         """Remove a simple command."""
         del self.bot.custom_commands[str(ctx.guild.id)][ctx.prefix + command]
-        with open("data/custom_commands.json", "w") as f:
-            json.dump(self.bot.custom_commands, f, indent=4)
+        self.bot.storage.delete_custom_command(ctx.guild.id, ctx.prefix + command)
         embed = discord.Embed(
             title="A command has been removed!", description=f"{ctx.prefix}{command}"
         )
@@ -343,7 +344,7 @@ class Admin(commands.Cog, name="Moderator"):
     @prefix.command()
     async def list(self, ctx):
         """List bot's prefixes."""
-        prefix = bot.get_prefix(self.bot, ctx.message)
+        prefix = list(self.bot.prefixes.get(ctx.guild).prefixes)
         if self.bot.user.mention in prefix:
             prefix.pop(0)
         prefixes = ", ".join([f"`{i}`" for i in prefix]).replace(
@@ -362,17 +363,16 @@ class Admin(commands.Cog, name="Moderator"):
     async def togglemention(self, ctx):
         """Toggle mention as prefix."""
         g = ctx.message.guild
-        with open("data/guild.json", "w") as f:
-            if self.bot.config[str(g.id)]["mention_as_prefix"] is True:
-                self.bot.config[str(g.id)]["mention_as_prefix"] = False
-                s = "Deactivated"
-            elif self.bot.config[str(g.id)]["mention_as_prefix"] is False:
-                self.bot.config[str(g.id)]["mention_as_prefix"] = True
-                s = "Activated"
-            else:
-                json.dump(self.bot.config, f, indent=4)
-                return
-            json.dump(self.bot.config, f, indent=4)
+        if self.bot.config[str(g.id)]["mention_as_prefix"] is True:
+            self.bot.config[str(g.id)]["mention_as_prefix"] = False
+            s = "Deactivated"
+        elif self.bot.config[str(g.id)]["mention_as_prefix"] is False:
+            self.bot.config[str(g.id)]["mention_as_prefix"] = True
+            s = "Activated"
+        else:
+            return
+        self.bot.storage.save_guild(g.id, self.bot.config[str(g.id)])
+        self.bot.prefixes.invalidate(g)
         embed = discord.Embed(title=f"Mention as prefix has been `{s}`")
         await ctx.send(embed=embed)
 
@@ -388,9 +388,9 @@ class Admin(commands.Cog, name="Moderator"):
         prefixes = [i for i in list(prefix) if not regex.match(i)]
         if not prefixes:
             return
-        with open("data/guild.json", "w") as f:
-            self.bot.config[str(g.id)]["prefix"] = prefixes
-            json.dump(self.bot.config, f, indent=4)
+        self.bot.config[str(g.id)]["prefix"] = prefixes
+        self.bot.storage.save_guild(g.id, self.bot.config[str(g.id)])
+        self.bot.prefixes.invalidate(g)
         embed = discord.Embed(
             title=f"Prefix has been changed to `{', '.join(prefixes)}`"
         )
@@ -419,8 +419,8 @@ class Admin(commands.Cog, name="Moderator"):
                 self.bot.config[str(g.id)]["prefix"].append(prefix)
                 added.append(prefix)
         if len(added) > 0:
-            with open("data/guild.json", "w") as f:
-                json.dump(self.bot.config, f, indent=4)
+            self.bot.storage.save_guild(g.id, self.bot.config[str(g.id)])
+            self.bot.prefixes.invalidate(g)
             await ctx.send(f"`{', '.join(added)}` successfully added to prefix")
             return
         await ctx.send("No prefix successfully added")
@@ -443,8 +443,8 @@ class Admin(commands.Cog, name="Moderator"):
                 not_removed.append(prefix)
                 pass
         if len(removed) > 0:
-            with open("data/guild.json", "w") as f:
-                json.dump(self.bot.config, f, indent=4)
+            self.bot.storage.save_guild(g.id, self.bot.config[str(g.id)])
+            self.bot.prefixes.invalidate(g)
             await ctx.send(f"`{', '.join(removed)}` successfully removed from prefix")
             return
         await ctx.send("No prefix successfully removed")
@@ -453,15 +453,150 @@ class Admin(commands.Cog, name="Moderator"):
     @is_botmaster()
     async def setvar(self, ctx, key, *, value):
         """Set a config variable, ***use with caution!**"""
-        with open("data/guild.json", "w") as f:
-            if value[0] == "[" and value[len(value) - 1] == "]":
-                value = list(map(int, value[1:-1].split(",")))
-            try:
-                value = int(value)
-            except ValueError:
-                pass
-            self.bot.config[str(ctx.message.guild.id)][key] = value
-            json.dump(self.bot.config, f, indent=4)
+        if value[0] == "[" and value[len(value) - 1] == "]":
+            value = list(map(int, value[1:-1].split(",")))
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            pass
+        g = ctx.message.guild
+        self.bot.config[str(g.id)][key] = value
+        self.bot.storage.save_guild(g.id, self.bot.config[str(g.id)])
+        self.bot.prefixes.invalidate(g)
+
+    @commands.command(hidden=True)
+    @is_botmaster()
+    async def startup(self, ctx):
+        """Show how long extensions and lazy imports took to load."""
+        exts = "\n".join(
+            f"`{ext}`: {imported * 1000:.1f}ms + {setup * 1000:.1f}ms"
+            for ext, (imported, setup) in self.bot.extension_times.items()
+        )
+        lazy = "\n".join(
+            f"`{name}`: {seconds * 1000:.1f}ms" for name, seconds in lazy_times.items()
+        )
+        embed = discord.Embed(
+            title="Startup",
+            description=f"Ready in {self.bot.ready_time or 0:.2f}s",
+            colour=discord.Colour(0x2F3136),
+        )
+        embed.add_field(
+            name="Extensions (import + setup)", value=exts or "None", inline=False
+        )
+        embed.add_field(name="Lazy imports", value=lazy or "None yet", inline=False)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="storage", hidden=True)
+    @is_botmaster()
+    async def storage_stats(self, ctx):
+        """Show storage write-behind stats."""
+        stats = self.bot.storage.stats()
+        embed = discord.Embed(
+            title=f"Storage ({type(self.bot.storage).__name__})",
+            colour=discord.Colour(0x2F3136),
+        )
+        if not stats:
+            embed.description = "Writes go straight to the storage."
+        for key, value in stats.items():
+            if isinstance(value, float):
+                value = f"{value:.2f}"
+            embed.add_field(name=key.replace("_", " ").title(), value=value)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="http", hidden=True)
+    @is_botmaster()
+    async def http_stats(self, ctx):
+        """Show request stats of the shared HTTP client per host."""
+        embed = discord.Embed(title="HTTP", colour=discord.Colour(0x2F3136))
+        if not self.bot.session.stats:
+            embed.description = "No requests yet."
+        for host, stats in sorted(self.bot.session.stats.items()):
+            embed.add_field(
+                name=host,
+                value=f"{stats.requests} requests, {stats.errors} errors"
+                + f", {stats.retries} retries\n"
+                + f"avg {stats.avg_time * 1000:.0f}ms, max {stats.max_time * 1000:.0f}ms",
+                inline=False,
+            )
+        poster = self.bot.poster
+        if poster.messages:
+            embed.add_field(
+                name="Bulk posts",
+                value=f"{poster.embeds} embeds in {poster.messages} messages"
+                + f", {poster.fallbacks} without a webhook"
+                + f", webhooks in {sum(map(bool, poster.webhooks.values()))} channels",
+                inline=False,
+            )
+        await ctx.send(embed=embed)
+
+    @commands.command(name="cache", hidden=True)
+    @is_botmaster()
+    async def cache_stats(self, ctx):
+        """Show hit/miss ratios of the API response cache."""
+        cache = self.bot.session.cache
+        embed = discord.Embed(
+            title="API Cache",
+            description=f"{len(cache.entries)}/{cache.max_entries} entries"
+            + f", {cache.evictions} evicted",
+            colour=discord.Colour(0x2F3136),
+        )
+        for endpoint, stats in sorted(cache.stats.items()):
+            embed.add_field(
+                name=endpoint,
+                value=f"{stats.ratio:.0%} hit ratio\n"
+                + f"{stats.hits} hits, {stats.stale} stale, {stats.coalesced} coalesced"
+                + f", {stats.misses} misses, {stats.errors} failed refreshes",
+                inline=False,
+            )
+        anilist = self.bot.get_cog("AniList")
+        if anilist:
+            media = anilist.media_cache
+            embed.add_field(
+                name="AniList media",
+                value=f"{len(media.entries)} entries ({media.size / 1024:.0f}KiB)"
+                + f", {media.hits} hits, {media.misses} misses"
+                + f", {media.evictions} evicted",
+                inline=False,
+            )
+            titles = anilist.titles
+            embed.add_field(
+                name="AniList titles",
+                value=f"{len(titles.titles)} anime indexed"
+                + f", {titles.hits} names resolved offline, {titles.misses} searched",
+                inline=False,
+            )
+        mcbe = self.bot.get_cog("MCBE")
+        if mcbe:
+            meta = mcbe.meta
+            embed.add_field(
+                name="speedrun.com metadata",
+                value=f"{len(meta.resources)} resources, {meta.updated} updated"
+                + f", {meta.not_modified} unchanged",
+                inline=False,
+            )
+        await ctx.send(embed=embed)
+
+    @commands.command(hidden=True, usage="[amount]")
+    @is_botmaster()
+    async def stalls(self, ctx, amount: int = 5):
+        """Show what blocked the event loop the most recently."""
+        watchdog = self.bot.watchdog
+        embed = discord.Embed(
+            title="Event Loop Stalls",
+            description=f"{watchdog.total} stalls over {watchdog.threshold}s"
+            + f" since start, last {len(watchdog.stalls)} ranked",
+            colour=discord.Colour(0x2F3136),
+        )
+        for offender, (count, total, worst) in watchdog.top(amount):
+            # Innermost frames are the interesting ones
+            stack = watchdog.stacks[offender][-700:]
+            embed.add_field(
+                name=offender[:256],
+                value=f"{count}x, {total:.2f}s total, {worst:.2f}s worst"
+                + f"\n```{stack}```",
+                inline=False,
+            )
+        await ctx.send(embed=embed)
 
     @commands.command(usage="[variable]")
     @commands.check_any(is_mod(), is_botmaster())
@@ -477,11 +612,10 @@ class Admin(commands.Cog, name="Moderator"):
     @is_botmaster()
     async def delvar(self, ctx, key):
         """Deletes a config variable, be careful!"""
-        with open("data/guild.json", "w") as f:
-            await ctx.send(
-                f"Removed {self.bot.config[str(ctx.message.guild.id)].pop(key)}"
-            )
-            json.dump(self.bot.config, f, indent=4)
+        g = ctx.message.guild
+        await ctx.send(f"Removed {self.bot.config[str(g.id)].pop(key)}")
+        self.bot.storage.save_guild(g.id, self.bot.config[str(g.id)])
+        self.bot.prefixes.invalidate(g)
 
     @commands.command()
     @is_botmaster()
@@ -527,18 +661,15 @@ class Admin(commands.Cog, name="Moderator"):
                     title=f"Text Channel called `{ch.name}` has been created!"
                 )
             else:
-                with open("data/guild.json", "w") as f:
-
-                    key = ch_types[_type.lower()]
+                key = ch_types[_type.lower()]
 
-                    try:
-                        value = int(ch.id)
-                    except ValueError:
-                        json.dump(self.bot.config, f, indent=4)
-                        return
+                try:
+                    value = int(ch.id)
+                except ValueError:
+                    return
 
-                    self.bot.config[str(ctx.message.guild.id)][key] = value
-                    json.dump(self.bot.config, f, indent=4)
+                self.bot.config[str(g.id)][key] = value
+                self.bot.storage.save_guild(g.id, self.bot.config[str(g.id)])
                 e = discord.Embed(
                     title=f"Text Channel for {_type.title()} "
                     + f"called `{ch.name}` has been created!"
@@ -579,13 +710,12 @@ class Admin(commands.Cog, name="Moderator"):
             return
 
         # If all good do the thing
-        with open("data/guild.json", "w") as f:
-
-            key = ch_types[_type.lower()]
-            value = _id
+        key = ch_types[_type.lower()]
+        value = _id
 
-            self.bot.config[str(ctx.message.guild.id)][key] = value
-            json.dump(self.bot.config, f, indent=4)
+        g = ctx.message.guild
+        self.bot.config[str(g.id)][key] = value
+        self.bot.storage.save_guild(g.id, self.bot.config[str(g.id)])
         e = discord.Embed(title=f"``{ch.name}``'s type has been changed to ``{_type}``")
         await ctx.send(embed=e)
 
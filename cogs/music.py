@@ -27,7 +27,10 @@ import sys
 import traceback
 from async_timeout import timeout
 from functools import partial
-from youtube_dl import YoutubeDL
+from utilities.startup import Lazy, lazy_import
+
+# youtube_dl takes a while to import, only load it when someone plays music
+youtube_dl = lazy_import("youtube_dl")
 
 
 ytdlopts = {
@@ -46,7 +49,7 @@ ytdlopts = {
 
 ffmpegopts = {"before_options": "-nostdin", "options": "-vn"}
 
-ytdl = YoutubeDL(ytdlopts)
+ytdl = Lazy(lambda: youtube_dl.YoutubeDL(ytdlopts), "YoutubeDL")
 
 
 class VoiceConnectionError(commands.CommandError):
@@ -5,11 +5,12 @@ import discord
 import logging
 import time
 
-from aiogoogletrans import Translator
 from discord.ext import commands
 from utilities.formatting import realtime
+from utilities.startup import Lazy, lazy_import
 
-translator = Translator()
+aiogoogletrans = lazy_import("aiogoogletrans")
+translator = Lazy(lambda: aiogoogletrans.Translator(), "Translator")
 
 
 class Utils(commands.Cog):
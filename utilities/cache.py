@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import time
+
+from collections import OrderedDict
+from yarl import URL
+
+# endpoint: (fresh for, then served stale while refreshing for) in seconds,
+# a TTL of 0 only coalesces concurrent requests
+TTLS = {
+    "weather": (600, 1800),
+    "covid": (3600, 6 * 3600),
+    "xbox": (300, 3600),
+    "anime": (3600, 6 * 3600),
+    "speedrun": (300, 1800),
+    # Random joke on every call, caching it would repeat the same joke
+    "dadjoke": (0, 0),
+}
+DEFAULT_TTL = (60, 300)
+
+
+def request_key(method, url, params=None, json_body=None, data=None):
+    """Normalise a request so equivalent ones share a cache entry."""
+    url = URL(url)
+    query = sorted(url.query.items())
+    if params:
+        query += sorted((str(k), str(v)) for k, v in dict(params).items())
+        query.sort()
+    url = url.with_query(None).with_fragment(None)
+    body = ""
+    if json_body is not None:
+        body = json.dumps(json_body, sort_keys=True, separators=(",", ":"))
+    elif data is not None:
+        body = data if isinstance(data, str) else repr(data)
+    return (
+        method.upper(),
+        str(url.with_host(url.host.lower()) if url.host else url),
+        tuple(query),
+        body,
+    )
+
+
+class CacheEntry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value, ttl, stale):
+        now = time.monotonic()
+        self.value = value
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale
+
+
+class CacheStats:
+    __slots__ = ("hits", "stale", "misses", "coalesced", "errors")
+
+    def __init__(self):
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @property
+    def ratio(self):
+        total = self.hits + self.stale + self.misses + self.coalesced
+        return (self.hits + self.stale + self.coalesced) / total if total else 0.0
+
+
+class ResponseCache:
+    """LRU cache with per-endpoint TTLs for outbound API calls.
+
+    Fresh entries are served as is, stale ones are served while a single
+    background fetch refreshes them, and concurrent misses for the same key
+    share one in-flight fetch."""
+
+    def __init__(self, max_entries=1024, ttls=None, cacheable=None):
+        self.logger = logging.getLogger("discord")
+        self.max_entries = max_entries
+        self.ttls = dict(TTLS, **(ttls or {}))
+        self.cacheable = cacheable or (lambda value: True)
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.stats = {}
+        self.evictions = 0
+
+    def _stats(self, endpoint):
+        try:
+            return self.stats[endpoint]
+        except KeyError:
+            stats = self.stats[endpoint] = CacheStats()
+            return stats
+
+    def _store(self, endpoint, key, value):
+        ttl, stale = self.ttls.get(endpoint, DEFAULT_TTL)
+        if ttl <= 0 or not self.cacheable(value):
+            return
+        self.entries[key] = CacheEntry(value, ttl, stale)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _fetch(self, endpoint, key, fetch):
+        """Start fetching `key` unless it's already being fetched."""
+        try:
+            return self.inflight[key], True
+        except KeyError:
+            pass
+
+        async def run():
+            try:
+                value = await fetch()
+                self._store(endpoint, key, value)
+                return value
+            finally:
+                self.inflight.pop(key, None)
+
+        task = self.inflight[key] = asyncio.ensure_future(run())
+        return task, False
+
+    def _refresh_done(self, endpoint, task):
+        if not task.cancelled() and task.exception() is not None:
+            self._stats(endpoint).errors += 1
+            self.logger.warning(
+                f"Refreshing cached {endpoint} failed: {task.exception()!r}"
+            )
+
+    async def get(self, endpoint, key, fetch):
+        """Return the cached value of `key`, calling `fetch()` when needed."""
+        key = (endpoint, key)
+        stats = self._stats(endpoint)
+        entry = self.entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None and now < entry.stale_until:
+            self.entries.move_to_end(key)
+            if now < entry.fresh_until:
+                stats.hits += 1
+            else:
+                stats.stale += 1
+                task, running = self._fetch(endpoint, key, fetch)
+                if not running:
+                    task.add_done_callback(
+                        lambda t: self._refresh_done(endpoint, t)
+                    )
+            return entry.value
+
+        task, running = self._fetch(endpoint, key, fetch)
+        if running:
+            stats.coalesced += 1
+        else:
+            stats.misses += 1
+        # Shielded so one cancelled caller doesn't cancel it for everyone
+        return await asyncio.shield(task)
+
+    def invalidate(self, endpoint=None):
+        if endpoint is None:
+            self.entries.clear()
+            return
+        for key in [k for k in self.entries if k[0] == endpoint]:
+            del self.entries[key]
+
+
+class MediaCache:
+    """Size-bounded LRU of AniList media that survives restarts, entries are
+    persisted through the bot's storage.
+
+    Every entry carries its own expiry timestamp so callers decide how long
+    each value stays fresh."""
+
+    def __init__(self, storage, max_size=8 * 1024 * 1024):
+        self.storage = storage
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Soonest to expire first, so those get evicted first on startup
+        cached = sorted(storage.load_media_cache().items(), key=lambda i: i[1][0])
+        for key, (expires, value) in cached:
+            self._add(key, value, expires)
+        self._evict()
+
+    def _add(self, key, value, expires):
+        size = len(json.dumps(value))
+        self.size += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        self.entries[key] = (expires, value)
+        self.entries.move_to_end(key)
+
+    def _evict(self, keep=None):
+        evicted = []
+        while self.size > self.max_size and len(self.entries) > 1:
+            key = next(iter(self.entries))
+            if key == keep:
+                break
+            del self.entries[key]
+            self.size -= self.sizes.pop(key)
+            evicted.append(key)
+        if evicted:
+            self.evictions += len(evicted)
+            self.storage.delete_media(evicted)
+
+    def get(self, key):
+        """Return the value of `key` or None if it's missing or expired."""
+        try:
+            expires, value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        if expires <= time.time():
+            # Kept around, set() will replace it once it's refetched
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expires):
+        self._add(key, value, expires)
+        self.storage.save_media(key, value, expires)
+        self._evict(keep=key)
@@ -0,0 +1,198 @@
+import aiohttp
+import asyncio
+import json
+import logging
+import time
+
+from utilities.cache import ResponseCache, request_key
+from yarl import URL
+
+# Worth retrying, everything else is returned to the caller as is
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class Response:
+    """Already read response, so callers don't have to juggle context managers."""
+
+    __slots__ = ("status", "headers", "text", "url")
+
+    def __init__(self, status, headers, text, url):
+        self.status = status
+        self.headers = headers
+        self.text = text
+        self.url = url
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HostStats:
+    __slots__ = ("requests", "errors", "retries", "total_time", "max_time")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def avg_time(self):
+        return self.total_time / self.requests if self.requests else 0.0
+
+
+class HTTPClient:
+    """One pooled HTTP client owned by the bot and shared by every cog.
+
+    Wraps a single `aiohttp.ClientSession` with per-host connection limits,
+    keep-alive, DNS caching, timeouts and retry with exponential backoff.
+    Cogs reach it through `bot.session` and must not close it themselves.
+    Requests made with `cache="<endpoint>"` go through `self.cache`."""
+
+    def __init__(
+        self,
+        *,
+        limit=100,
+        limit_per_host=10,
+        dns_ttl=300,
+        timeout=30,
+        retries=2,
+        backoff=0.5,
+        headers=None,
+    ):
+        self.logger = logging.getLogger("discord")
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=10)
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = headers or {"User-Agent": "ziBot"}
+        self.stats = {}
+        # Called with (host, seconds) after every attempt, used by metrics
+        self.listeners = []
+        # Only successful responses are worth keeping
+        self.cache = ResponseCache(cacheable=lambda resp: resp.status == 200)
+        self._session = None
+
+    @property
+    def session(self):
+        # Created lazily so it's bound to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=30,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout, headers=self.headers
+            )
+        return self._session
+
+    def _host_stats(self, host):
+        try:
+            return self.stats[host]
+        except KeyError:
+            stats = self.stats[host] = HostStats()
+            return stats
+
+    async def request(
+        self,
+        method,
+        url,
+        *,
+        cache=None,
+        retries=None,
+        limiter=None,
+        priority=0,
+        **kwargs,
+    ):
+        """Send a request and return a read `Response`.
+
+        Only GETs are retried by default, pass `retries` for idempotent POSTs
+        (e.g. GraphQL queries). `cache` names the endpoint whose TTLs apply,
+        see `utilities.cache.TTLS`. Every attempt that actually hits the
+        network first waits for `limiter` (a `RateGovernor`) with `priority`."""
+        options = dict(retries=retries, limiter=limiter, priority=priority)
+        if cache is not None:
+            key = request_key(
+                method,
+                url,
+                kwargs.get("params"),
+                kwargs.get("json"),
+                kwargs.get("data"),
+            )
+            return await self.cache.get(
+                cache,
+                key,
+                lambda: self._request(method, url, **options, **kwargs),
+            )
+        return await self._request(method, url, **options, **kwargs)
+
+    async def _request(
+        self, method, url, *, retries=None, limiter=None, priority=0, **kwargs
+    ):
+        if retries is None:
+            retries = self.retries if method == "GET" else 0
+        host = URL(url).host or "unknown"
+        stats = self._host_stats(host)
+
+        attempt = 0
+        while True:
+            if limiter is not None:
+                await limiter.acquire(priority)
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, url, **kwargs) as resp:
+                    response = Response(
+                        resp.status, resp.headers, await resp.text(), str(resp.url)
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                response = None
+                error = e
+            finally:
+                elapsed = time.perf_counter() - start
+                stats.requests += 1
+                stats.total_time += elapsed
+                stats.max_time = max(stats.max_time, elapsed)
+                for listener in self.listeners:
+                    listener(host, elapsed)
+
+            if response is not None and limiter is not None:
+                limiter.update(response.status, response.headers)
+            if response is not None and response.status not in RETRY_STATUSES:
+                return response
+
+            stats.errors += 1
+            if attempt >= retries:
+                if response is not None:
+                    return response
+                raise error
+
+            delay = self.backoff * 2 ** attempt
+            if limiter is not None and response is not None and response.status == 429:
+                # The limiter already holds everyone back until Retry-After
+                delay = 0
+            elif response is not None and "Retry-After" in response.headers:
+                try:
+                    delay = max(delay, float(response.headers["Retry-After"]))
+                except ValueError:
+                    pass
+            self.logger.info(
+                f"{method} {url} failed "
+                + f"({response.status if response else error!r}), retrying in {delay}s"
+            )
+            stats.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
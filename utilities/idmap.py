@@ -0,0 +1,64 @@
+import json
+import re
+import sys
+
+MAL_URL = re.compile(r"myanimelist\.net/anime/(\d+)")
+ANILIST_URL = re.compile(r"anilist\.co/anime/(\d+)")
+
+
+class IdMap:
+    """MyAnimeList -> AniList ids, persisted through the bot's storage.
+
+    The mapping never changes, so it's filled whenever we learn about a pair
+    and kept forever."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.ids = storage.load_mal_ids()
+
+    def get(self, mal_id):
+        return self.ids.get(int(mal_id))
+
+    def update(self, pairs):
+        """Add (mal_id, anilist_id) pairs, returns how many were new."""
+        new = []
+        for mal_id, media_id in pairs:
+            mal_id, media_id = int(mal_id), int(media_id)
+            if self.ids.get(mal_id) != media_id:
+                self.ids[mal_id] = media_id
+                new.append((mal_id, media_id))
+        if new:
+            self.storage.save_mal_ids(new)
+        return len(new)
+
+    def add(self, mal_id, media_id):
+        self.update([(mal_id, media_id)])
+
+
+def read_dump(path):
+    """Yield (mal_id, anilist_id) pairs from a dump file.
+
+    Either manami-project's anime-offline-database JSON or plain text with
+    one "mal_id anilist_id" pair per line (comma, tab or space separated)."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            for anime in json.load(f)["data"]:
+                sources = " ".join(anime.get("sources", []))
+                mal, anilist = MAL_URL.search(sources), ANILIST_URL.search(sources)
+                if mal and anilist:
+                    yield int(mal.group(1)), int(anilist.group(1))
+            return
+        for line in f:
+            fields = re.split(r"[,\t ]+", line.strip())
+            if len(fields) >= 2 and fields[0].isdigit() and fields[1].isdigit():
+                yield int(fields[0]), int(fields[1])
+
+
+if __name__ == "__main__":
+    # python3 -m utilities.idmap <dump file>, stop the bot first on JSON storage
+    from utilities.storage import get_storage
+
+    storage = get_storage()
+    added = IdMap(storage).update(read_dump(sys.argv[1]))
+    storage.close()
+    print(f"Added {added} MyAnimeList ids")
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+from utilities.storage import atomic_write
+
+
+def shard_ranges(shard_count, clusters):
+    """Split shards into `clusters` contiguous ranges, e.g. 5, 2 -> [0-2], [3-4]."""
+    clusters = max(1, min(clusters, shard_count))
+    size, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Cluster:
+    """A bot process running one range of shards."""
+
+    def __init__(self, cluster_id, shard_ids, shard_count):
+        self.id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.state = "stopped"
+        self.started = None
+        self.restarts = 0
+        self.last_exit = None
+
+    @property
+    def name(self):
+        return f"Cluster {self.id} (shards {self.shard_ids[0]}-{self.shard_ids[-1]})"
+
+    @property
+    def health_file(self):
+        return f"data/cluster-{self.id}.json"
+
+    def env(self):
+        return dict(
+            os.environ,
+            CLUSTER_ID=str(self.id),
+            SHARD_IDS=",".join(str(i) for i in self.shard_ids),
+            SHARD_COUNT=str(self.shard_count),
+        )
+
+    def heartbeat(self):
+        try:
+            with open(self.health_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+
+
+class Launcher:
+    """Run every shard cluster as its own process and keep them alive.
+
+    Crashed clusters are restarted with exponential backoff, their output is
+    forwarded to our logger and their heartbeats are collected into
+    `data/clusters.json`."""
+
+    def __init__(
+        self,
+        shard_count,
+        clusters,
+        *,
+        health_interval=30,
+        stale_after=180,
+        max_backoff=300,
+    ):
+        self.logger = logging.getLogger("discord")
+        self.clusters = [
+            Cluster(i, shards, shard_count)
+            for i, shards in enumerate(shard_ranges(shard_count, clusters))
+        ]
+        self.health_interval = health_interval
+        self.stale_after = stale_after
+        self.max_backoff = max_backoff
+        self.stopping = False
+        self._stopped = None
+
+    async def _pump(self, cluster, stream):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Over the stream's 64 KiB limit, readline already dropped it
+                self.logger.warning(f"[{cluster.id}] (dropped part of an overlong line)")
+                continue
+            if not line:
+                break
+            self.logger.info(
+                f"[{cluster.id}] {line.decode('utf-8', 'replace').rstrip()}"
+            )
+
+    async def run_cluster(self, cluster):
+        backoff = 1
+        while not self.stopping:
+            cluster.state = "starting"
+            cluster.started = time.time()
+            try:
+                cluster.process = await asyncio.create_subprocess_exec(
+                    sys.executable,
+                    "zibot.py",
+                    env=cluster.env(),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                )
+            except OSError as e:
+                # e.g. out of file descriptors, back off like any other crash
+                cluster.process = None
+                cluster.last_exit = None
+                reason = f"failed to start ({e!r})"
+            else:
+                cluster.state = "running"
+                self.logger.warning(
+                    f"{cluster.name} started (PID {cluster.process.pid})"
+                )
+                await self._pump(cluster, cluster.process.stdout)
+                cluster.last_exit = await cluster.process.wait()
+                reason = f"exited with code {cluster.last_exit}"
+            cluster.state = "stopped"
+            if self.stopping:
+                break
+
+            # Only back off when it keeps dying right after starting
+            if time.time() - cluster.started > 60:
+                backoff = 1
+            self.logger.error(
+                f"{cluster.name} {reason}, restarting in {backoff}s"
+            )
+            cluster.state = "restarting"
+            try:
+                await asyncio.wait_for(self._stopped.wait(), backoff)
+                break
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, self.max_backoff)
+            cluster.restarts += 1
+
+    def health(self):
+        now = time.time()
+        report = {}
+        for cluster in self.clusters:
+            beat = cluster.heartbeat() or {}
+            report[cluster.id] = {
+                "shards": cluster.shard_ids,
+                "state": cluster.state,
+                "pid": cluster.process.pid if cluster.process else None,
+                "uptime": round(now - cluster.started) if cluster.started else 0,
+                "restarts": cluster.restarts,
+                "last_exit": cluster.last_exit,
+                "heartbeat_age": round(now - beat["time"]) if beat else None,
+                "ready": beat.get("ready"),
+                "latency": beat.get("latency"),
+                "guilds": beat.get("guilds"),
+            }
+        return report
+
+    async def watch_health(self):
+        while not self.stopping:
+            await asyncio.sleep(self.health_interval)
+            report = self.health()
+            atomic_write("data/clusters.json", json.dumps(report, indent=4))
+            for cluster in self.clusters:
+                stats = report[cluster.id]
+                age = stats["heartbeat_age"]
+                if cluster.state != "running":
+                    continue
+                # A cluster that's alive but stopped beating is stuck, kill it
+                if stats["uptime"] > self.stale_after and (
+                    age is None or age > self.stale_after
+                ):
+                    self.logger.error(f"{cluster.name} stopped responding, killing it")
+                    cluster.process.kill()
+            self.logger.info(
+                "Clusters: "
+                + ", ".join(
+                    f"{i}={s['state']}/{s['guilds']} guilds/{s['restarts']} restarts"
+                    for i, s in report.items()
+                )
+            )
+
+    def stop(self):
+        self.stopping = True
+        self._stopped.set()
+        for cluster in self.clusters:
+            if cluster.process and cluster.process.returncode is None:
+                cluster.process.terminate()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        watcher = loop.create_task(self.watch_health())
+        await asyncio.gather(*[self.run_cluster(c) for c in self.clusters])
+        watcher.cancel()
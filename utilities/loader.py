@@ -0,0 +1,61 @@
+import asyncio
+
+
+class DataLoader:
+    """Coalesce single-key lookups into batched fetches.
+
+    Keys passed to `load()` within `window` seconds of each other (from any
+    command or guild) are fetched with one call to `batch(keys)`, which
+    returns a {key: value} dict. Missing keys resolve to None and a key
+    that's already being fetched is only fetched once."""
+
+    def __init__(self, batch, *, window=0.02, max_batch=50):
+        self.batch = batch
+        self.window = window
+        self.max_batch = max_batch
+        self.loads = 0
+        self.batches = 0
+        self._pending = {}
+        self._inflight = {}
+        self._handle = None
+
+    def _dispatch(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            self._inflight.update(pending)
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        self.batches += 1
+        try:
+            results = await self.batch(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for key, future in pending.items():
+                if not future.done():
+                    future.set_result(results.get(key))
+        finally:
+            for key in pending:
+                self._inflight.pop(key, None)
+
+    async def load(self, key):
+        self.loads += 1
+        future = self._pending.get(key) or self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = self._pending[key] = loop.create_future()
+            if len(self._pending) >= self.max_batch:
+                self._dispatch()
+            elif self._handle is None:
+                self._handle = loop.call_later(self.window, self._dispatch)
+        # Shared with other callers, don't let one of them cancel it
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys):
+        return await asyncio.gather(*[self.load(key) for key in keys])
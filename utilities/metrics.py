@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+
+from aiohttp import web
+from discord.ext import commands
+
+# Seconds, from a snappy reply up to a slow youtube_dl extraction
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def render(self, name, **labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {self.count}')
+        lines.append(f"{name}_sum{_labels(**labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {self.count}")
+        return lines
+
+
+class Metrics:
+    """Collect bot metrics and serve them in Prometheus text format.
+
+    Commands are timed from `on_command` until completion or error, the rest
+    (latency, HTTP, caches, music queues) is read from the bot when scraped."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = logging.getLogger("discord")
+        self.commands = {}
+        self.command_errors = {}
+        self.command_latency = {}
+        self.http_latency = {}
+        self.loop_lag = Histogram(LAG_BUCKETS)
+        self.last_lag = 0.0
+        self._lag_task = None
+        self._runner = None
+        bot.session.listeners.append(self.observe_http)
+
+    def command_started(self, ctx):
+        ctx.metrics_start = time.perf_counter()
+
+    def command_finished(self, ctx, error=None):
+        if ctx.command is None:
+            return
+        name = ctx.command.qualified_name
+        self.commands[name] = self.commands.get(name, 0) + 1
+        if error is not None:
+            if isinstance(error, commands.CommandInvokeError):
+                error = error.original
+            key = (name, type(error).__name__)
+            self.command_errors[key] = self.command_errors.get(key, 0) + 1
+        start = getattr(ctx, "metrics_start", None)
+        if start is None:
+            # Failed before on_command fired (e.g. bad arguments)
+            return
+        try:
+            histogram = self.command_latency[name]
+        except KeyError:
+            histogram = self.command_latency[name] = Histogram()
+        histogram.observe(time.perf_counter() - start)
+
+    def observe_http(self, host, elapsed):
+        try:
+            histogram = self.http_latency[host]
+        except KeyError:
+            histogram = self.http_latency[host] = Histogram()
+        histogram.observe(elapsed)
+
+    async def watch_loop(self, interval=1.0):
+        """Measure how late the event loop wakes us up."""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.last_lag = max(0.0, time.perf_counter() - start - interval)
+            self.loop_lag.observe(self.last_lag)
+
+    def render(self):
+        bot = self.bot
+        out = []
+
+        def family(name, kind, help_):
+            out.append(f"# HELP {name} {help_}")
+            out.append(f"# TYPE {name} {kind}")
+
+        family("zibot_commands_total", "counter", "Commands invoked.")
+        for name, count in sorted(self.commands.items()):
+            out.append(f"zibot_commands_total{_labels(command=name)} {count}")
+        family("zibot_command_errors_total", "counter", "Commands that failed.")
+        for (name, error), count in sorted(self.command_errors.items()):
+            out.append(
+                f"zibot_command_errors_total{_labels(command=name, error=error)} {count}"
+            )
+        family("zibot_command_seconds", "histogram", "Command latency.")
+        for name, histogram in sorted(self.command_latency.items()):
+            out += histogram.render("zibot_command_seconds", command=name)
+
+        family("zibot_gateway_latency_seconds", "gauge", "Heartbeat latency.")
+        for shard_id, latency in bot.latencies:
+            if latency == latency:  # NaN until the first heartbeat
+                out.append(
+                    f"zibot_gateway_latency_seconds{_labels(shard=shard_id)} {latency}"
+                )
+        family("zibot_guilds", "gauge", "Guilds on this process.")
+        out.append(f"zibot_guilds {len(bot.guilds)}")
+        family("zibot_loop_lag_seconds", "histogram", "Event loop lag.")
+        out += self.loop_lag.render("zibot_loop_lag_seconds")
+        family("zibot_loop_stalls_total", "counter", "Event loop stalls caught.")
+        out.append(f"zibot_loop_stalls_total {bot.watchdog.total}")
+
+        family("zibot_http_seconds", "histogram", "Outbound HTTP latency.")
+        for host, histogram in sorted(self.http_latency.items()):
+            out += histogram.render("zibot_http_seconds", host=host)
+        for field in ("requests", "errors", "retries"):
+            family(f"zibot_http_{field}_total", "counter", f"Outbound HTTP {field}.")
+            for host, stats in sorted(bot.session.stats.items()):
+                out.append(
+                    f"zibot_http_{field}_total{_labels(host=host)}"
+                    + f" {getattr(stats, field)}"
+                )
+
+        cache = bot.session.cache
+        for field in ("hits", "stale", "misses", "coalesced", "errors"):
+            family(f"zibot_cache_{field}_total", "counter", f"API cache {field}.")
+            for endpoint, stats in sorted(cache.stats.items()):
+                out.append(
+                    f"zibot_cache_{field}_total{_labels(endpoint=endpoint)}"
+                    + f" {getattr(stats, field)}"
+                )
+        family("zibot_cache_entries", "gauge", "API cache entries.")
+        out.append(f"zibot_cache_entries {len(cache.entries)}")
+        family("zibot_cache_evictions_total", "counter", "API cache evictions.")
+        out.append(f"zibot_cache_evictions_total {cache.evictions}")
+
+        anilist = bot.get_cog("AniList")
+        family(
+            "zibot_ratelimit_wait_seconds", "histogram", "Rate limit queue wait time."
+        )
+        if anilist:
+            for priority, histogram in sorted(anilist.governor.wait_time.items()):
+                out += histogram.render(
+                    "zibot_ratelimit_wait_seconds",
+                    api="anilist",
+                    priority=priority,
+                )
+
+        music = bot.get_cog("Music")
+        family("zibot_music_queue_depth", "gauge", "Songs queued per guild.")
+        for guild_id, player in sorted(getattr(music, "players", {}).items()):
+            out.append(
+                f"zibot_music_queue_depth{_labels(guild=guild_id)}"
+                + f" {player.queue.qsize()}"
+            )
+
+        return "\n".join(out) + "\n"
+
+    async def handle(self, request):
+        return web.Response(
+            text=self.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start(self, host, port):
+        self._lag_task = self.bot.loop.create_task(self.watch_loop())
+        if not port:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+        except OSError as e:
+            self.logger.error(f"Can't serve metrics on {host}:{port}: {e}")
+            return
+        self.logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
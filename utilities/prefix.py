@@ -0,0 +1,76 @@
+class PrefixMatcher:
+    """Match a message against a guild's prefixes in one pass.
+
+    Prefixes are bucketed by their first character and kept longest-first, so
+    ">>" wins over ">" and most messages are rejected after a single dict
+    lookup."""
+
+    __slots__ = ("prefixes", "_buckets")
+
+    def __init__(self, prefixes):
+        # dict.fromkeys() dedupes while keeping the user's order for ties
+        self.prefixes = sorted(dict.fromkeys(prefixes), key=len, reverse=True)
+        self._buckets = {}
+        for prefix in self.prefixes:
+            if prefix:
+                self._buckets.setdefault(prefix[0], []).append(prefix)
+
+    def match(self, content):
+        """Return the longest prefix `content` starts with, or None."""
+        if not content:
+            return None
+        for prefix in self._buckets.get(content[0], ()):
+            if content.startswith(prefix):
+                return prefix
+        return None
+
+
+class PrefixCache:
+    """In-memory prefix resolver backed by `bot.config`.
+
+    Matchers are built lazily per guild and must be invalidated whenever the
+    guild's `prefix` or `mention_as_prefix` config changes."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._matchers = {}
+
+    def _mentions(self):
+        user = self.bot.user
+        if user is None:
+            return []
+        return [f"<@{user.id}> ", f"<@!{user.id}> "]
+
+    def _build(self, guild_id):
+        try:
+            config = self.bot.config[guild_id]
+        except KeyError:
+            config = {}
+        prefixes = config.get("prefix") or [self.bot.def_prefix]
+        if isinstance(prefixes, str):
+            prefixes = [prefixes]
+        if config.get("mention_as_prefix"):
+            prefixes = self._mentions() + list(prefixes)
+        matcher = PrefixMatcher(prefixes)
+        self._matchers[guild_id] = matcher
+        return matcher
+
+    def get(self, guild):
+        """Get the compiled matcher for `guild` (None for DMs)."""
+        guild_id = str(guild.id) if guild else None
+        try:
+            return self._matchers[guild_id]
+        except KeyError:
+            pass
+        if guild_id is None:
+            matcher = PrefixMatcher([self.bot.def_prefix])
+            self._matchers[None] = matcher
+            return matcher
+        return self._build(guild_id)
+
+    def invalidate(self, guild=None):
+        """Drop the cached matcher of `guild` (or every guild if None)."""
+        if guild is None:
+            self._matchers.clear()
+            return
+        self._matchers.pop(str(getattr(guild, "id", guild)), None)
@@ -0,0 +1,115 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from utilities.metrics import Histogram
+
+# Lower goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITIES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class RateGovernor:
+    """Token bucket in front of a rate limited API.
+
+    Requests wait for a token instead of failing, queued by priority so
+    commands go before background refreshes. The bucket follows the API's
+    `X-RateLimit-*` headers and pauses entirely on `Retry-After`."""
+
+    def __init__(self, rate, per=60.0):
+        self.per = per
+        self.capacity = rate
+        self.fill_rate = rate / per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []
+        # Priority name: Histogram of seconds spent in acquire()
+        self.wait_time = {}
+        self._seq = itertools.count()
+        self._handle = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.fill_rate
+        )
+        self.updated = now
+        return now
+
+    def _take(self):
+        now = self._refill()
+        if now < self.paused_until or self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _schedule(self):
+        if self._handle is not None:
+            return
+        now = self._refill()
+        delay = max(self.paused_until - now, (1 - self.tokens) / self.fill_rate, 0)
+        loop = asyncio.get_event_loop()
+        self._handle = loop.call_later(delay, self._release)
+
+    def _release(self):
+        self._handle = None
+        while self.waiters:
+            future = self.waiters[0][2]
+            if future.done():
+                # Caller gave up waiting
+                heapq.heappop(self.waiters)
+                continue
+            if not self._take():
+                break
+            heapq.heappop(self.waiters)
+            future.set_result(None)
+        if self.waiters:
+            self._schedule()
+
+    def _observe(self, priority, seconds):
+        priority = PRIORITIES.get(priority, str(priority))
+        try:
+            histogram = self.wait_time[priority]
+        except KeyError:
+            histogram = self.wait_time[priority] = Histogram()
+        histogram.observe(seconds)
+
+    async def acquire(self, priority=INTERACTIVE):
+        """Wait until a request may be sent."""
+        start = time.monotonic()
+        if not self.waiters and self._take():
+            self._observe(priority, 0.0)
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._seq), future))
+        self._schedule()
+        await future
+        self._observe(priority, time.monotonic() - start)
+
+    def update(self, status, headers):
+        """Sync the bucket with the API's view of our budget."""
+        self._refill()
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+        except (KeyError, ValueError):
+            pass
+        else:
+            if limit != self.capacity:
+                self.capacity = limit
+                self.fill_rate = limit / self.per
+        try:
+            self.tokens = min(self.tokens, int(headers["X-RateLimit-Remaining"]))
+        except (KeyError, ValueError):
+            pass
+        if status == 429:
+            try:
+                retry_after = float(headers["Retry-After"])
+            except (KeyError, ValueError):
+                retry_after = self.per
+            self.tokens = 0
+            self.paused_until = max(
+                self.paused_until, time.monotonic() + retry_after
+            )
@@ -1,3 +1,6 @@
+import asyncio
+import heapq
+import logging
 import threading
 import time
 
@@ -36,6 +39,97 @@ class setTimeout:
             self.stopEvent.set()
 
 
+class Scheduler:
+    """Fire `callback(key, payload)` at wall clock deadlines from one task.
+
+    Timers are kept in a min-heap of (due, key) and persisted through the
+    bot's storage under `name`, so they survive restarts. Timers that came due
+    while the bot was down still fire if they're less than `grace` seconds
+    late. Due timers fire concurrently, a slow one never delays the next."""
+
+    def __init__(self, storage, name, callback, *, grace=60 * 60):
+        self.storage = storage
+        self.name = name
+        self.callback = callback
+        self.grace = grace
+        self.logger = logging.getLogger("discord")
+        self.timers = {}
+        self.heap = []
+        self.task = None
+        self._wakeup = None
+
+    def schedule(self, key, due, payload):
+        key = str(key)
+        timer = self.timers.get(key)
+        if timer is not None and timer == (due, payload):
+            return
+        self.timers[key] = (due, payload)
+        heapq.heappush(self.heap, (due, key))
+        self.storage.save_timer(self.name, key, due, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        key = str(key)
+        # Its heap entry is skipped once it reaches the top
+        if self.timers.pop(key, None) is not None:
+            self.storage.delete_timer(self.name, key)
+
+    def pending(self):
+        """Sorted [(due, key, payload)] of every timer."""
+        return sorted(
+            (due, key, payload) for key, (due, payload) in self.timers.items()
+        )
+
+    def _pop_due(self):
+        now = time.time()
+        while self.heap:
+            due, key = self.heap[0]
+            timer = self.timers.get(key)
+            if timer is None or timer[0] != due:
+                # Cancelled or rescheduled
+                heapq.heappop(self.heap)
+                continue
+            if due > now:
+                return due - now
+            heapq.heappop(self.heap)
+            del self.timers[key]
+            self.storage.delete_timer(self.name, key)
+            if now - due > self.grace:
+                self.logger.warning(
+                    f"Dropped {self.name} timer {key}, {now - due:.0f}s late"
+                )
+                continue
+            asyncio.ensure_future(self._fire(key, timer[1]))
+        return None
+
+    async def _fire(self, key, payload):
+        try:
+            await self.callback(key, payload)
+        except Exception:
+            self.logger.exception(f"{self.name} timer {key} failed:")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._pop_due()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        for key, (due, payload) in self.storage.load_timers(self.name).items():
+            self.timers[key] = (due, payload)
+            heapq.heappush(self.heap, (due, key))
+        self._wakeup = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+
 # usage example:
 ## --- start action every 0.6s
 # inter=setInterval(0.6,action)
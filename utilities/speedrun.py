@@ -0,0 +1,130 @@
+import asyncio
+import logging
+
+from utilities.formatting import pformat
+
+SRC_API = "https://www.speedrun.com/api/v1"
+
+
+def resources(game):
+    return [
+        f"games/{game}",
+        f"games/{game}/categories",
+        f"games/{game}/levels",
+        f"games/{game}/variables",
+    ]
+
+
+class SpeedrunMeta:
+    """speedrun.com game, category, level and variable metadata kept locally.
+
+    Loaded from the bot's storage and refreshed with conditional requests,
+    so unchanged resources only cost a 304. Names are indexed by `pformat`,
+    resolving a category or seed type never touches the API."""
+
+    def __init__(self, storage, session, games):
+        self.logger = logging.getLogger("discord")
+        self.storage = storage
+        self.session = session
+        self.games = games
+        # resource: (etag, last modified, data)
+        self.resources = storage.load_speedrun_meta()
+        self.updated = 0
+        self.not_modified = 0
+        self.lock = asyncio.Lock()
+        self._index()
+
+    def _index(self):
+        # game id: {pformat(name): full game category or level}
+        self.categories = {}
+        self.levels = {}
+        # variable id: variable
+        self.variables = {}
+        for game in self.games:
+            categories = self.data(f"games/{game}/categories") or []
+            self.categories[game] = {
+                pformat(c["name"]): c for c in categories if c["type"] == "per-game"
+            }
+            levels = self.data(f"games/{game}/levels") or []
+            self.levels[game] = {pformat(l["name"]): l for l in levels}
+            for variable in self.data(f"games/{game}/variables") or []:
+                self.variables[variable["id"]] = variable
+        # variable id: {pformat(label): value id}
+        self.values = {
+            variable_id: {
+                pformat(value["label"]): value_id
+                for value_id, value in variable["values"]["values"].items()
+            }
+            for variable_id, variable in self.variables.items()
+        }
+
+    @property
+    def loaded(self):
+        return all(
+            resource in self.resources
+            for game in self.games
+            for resource in resources(game)
+        )
+
+    def data(self, resource):
+        try:
+            return self.resources[resource][2]
+        except KeyError:
+            return None
+
+    async def fetch(self, resource):
+        """Refetch `resource` if it changed, returns whether it did."""
+        etag, modified, _ = self.resources.get(resource, (None, None, None))
+        headers = {"Accept": "application/json"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        resp = await self.session.get(f"{SRC_API}/{resource}", headers=headers)
+        if resp.status == 304:
+            self.not_modified += 1
+            return False
+        if resp.status != 200:
+            self.logger.warning(
+                f"Fetching speedrun.com {resource} failed: {resp.status}"
+            )
+            return False
+        entry = (
+            resp.headers.get("ETag"),
+            resp.headers.get("Last-Modified"),
+            resp.json()["data"],
+        )
+        self.resources[resource] = entry
+        self.storage.save_speedrun_meta(resource, *entry)
+        self.updated += 1
+        return True
+
+    async def refresh(self):
+        """Refetch every resource that changed since we last got it."""
+        async with self.lock:
+            results = await asyncio.gather(
+                *[self.fetch(r) for game in self.games for r in resources(game)],
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    self.logger.warning(
+                        f"Refreshing speedrun.com metadata failed: {result!r}"
+                    )
+            if True in results:
+                self._index()
+
+    async def ensure(self):
+        """Fetch whatever has never been fetched, e.g. on a fresh install."""
+        if not self.loaded:
+            await self.refresh()
+
+    def category(self, game, name):
+        return self.categories.get(game, {}).get(pformat(name))
+
+    def level(self, game, name):
+        return self.levels.get(game, {}).get(pformat(name))
+
+    def value(self, variable_id, label):
+        """Id of the value of a variable labeled `label`."""
+        return self.values.get(variable_id, {}).get(pformat(label))
@@ -0,0 +1,90 @@
+import importlib
+import importlib.abc
+import importlib.machinery
+import logging
+import sys
+import time
+
+# How long each lazily loaded module/object took on first use
+lazy_times = {}
+
+_MISSING = object()
+
+
+class Lazy:
+    """Stand-in that builds the real object the first time it's used.
+
+    Keeps heavy third-party modules (youtube_dl, praw, ...) out of the startup
+    path, they get imported on the first command that needs them instead."""
+
+    __slots__ = ("_factory", "_name", "_obj")
+
+    def __init__(self, factory, name):
+        self._factory = factory
+        self._name = name
+        self._obj = _MISSING
+
+    def _load(self):
+        if self._obj is _MISSING:
+            start = time.perf_counter()
+            self._obj = self._factory()
+            lazy_times[self._name] = time.perf_counter() - start
+            logging.getLogger("discord").info(
+                f"Lazily loaded {self._name} in {lazy_times[self._name] * 1000:.1f}ms"
+            )
+        return self._obj
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    """Import `name` on first attribute access."""
+    return Lazy(lambda: importlib.import_module(name), name)
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, name, times):
+        self.loader = loader
+        self.name = name
+        self.times = times
+
+    def __getattr__(self, attr):
+        # get_source() and friends, used by tracebacks
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.times[self.name] = time.perf_counter() - start
+
+
+class ExtensionTimer(importlib.abc.MetaPathFinder):
+    """Measure how long each extension's module body takes to import.
+
+    discord.py imports and sets up an extension in one call, while this is
+    installed on `sys.meta_path` the import part gets timed separately."""
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.times = {}
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in self.names:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is not None and spec.loader is not None:
+            spec.loader = _TimedLoader(spec.loader, fullname, self.times)
+        return spec
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc):
+        sys.meta_path.remove(self)
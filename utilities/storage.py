@@ -0,0 +1,866 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Before watchlists were per guild everything belonged to the main server
+LEGACY_ANIME_GUILD = "645074407244562444"
+LEGACY_ANIME_CHANNEL = 744528830382735421
+
+
+def atomic_write(path, text):
+    """Write to a temporary file first so a crash never leaves half a file."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def snapshot(data):
+    """Copy nested dicts and lists, a lot cheaper than dumping them."""
+    if isinstance(data, dict):
+        return {k: snapshot(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [snapshot(v) for v in data]
+    return data
+
+
+def dump_pretty(data):
+    return json.dumps(data, indent=4)
+
+
+def dump_compact(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def dump_media(media):
+    return json.dumps(
+        {
+            k: {"expires": expires, "data": data}
+            for k, (expires, data) in media.items()
+        }
+    )
+
+
+def on_shards(guild_id, shard_ids=None, shard_count=1):
+    """Check if a guild belongs to one of `shard_ids` (None means every shard)."""
+    if shard_ids is None:
+        return True
+    try:
+        return (int(guild_id) >> 22) % shard_count in shard_ids
+    except ValueError:
+        return False
+
+
+class WriteBehind:
+    """Coalesce file writes and flush them from a worker thread.
+
+    Writers only `mark()` which file (and which guild in it) changed, one task
+    serializes everything that's dirty at most every `interval` seconds and
+    hands the disk work to the default executor. `serialize(path)` returns
+    the file's text, or a callable rendering it from a cheap snapshot so the
+    dumping happens in the worker too."""
+
+    def __init__(self, serialize, interval=0.5):
+        self.serialize = serialize
+        self.interval = interval
+        self.dirty = {}
+        self.task = None
+        self._lock = None
+        self._write_lock = threading.Lock()
+
+        # Monitoring
+        self.flushes = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def pending(self):
+        """Amount of dirty keys (mostly guilds) waiting to be flushed."""
+        return sum(len(keys) for keys in self.dirty.values())
+
+    def mark(self, path, key=None):
+        self.dirty.setdefault(path, set()).add(key)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (e.g. the importer), just write it now
+            self.flush_now()
+            return
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # Marks landing during a write go to the fresh `dirty` and won't start
+        # another task while this one runs, keep going until nothing's left
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+            if not self.dirty:
+                break
+
+    def _take(self):
+        # Snapshot on the caller's thread, the bot keeps mutating these dicts
+        dirty, self.dirty = self.dirty, {}
+        return {path: self.serialize(path) for path in dirty}
+
+    def _write(self, snapshot):
+        with self._write_lock:
+            start = time.perf_counter()
+            for path, text in snapshot.items():
+                atomic_write(path, text() if callable(text) else text)
+            latency = time.perf_counter() - start
+        self.flushes += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.dirty:
+                return
+            snapshot = self._take()
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write, snapshot)
+
+    def flush_now(self):
+        if self.dirty:
+            self._write(self._take())
+
+    async def close(self):
+        if self.task and self.task is not asyncio.current_task():
+            self.task.cancel()
+        await self.flush()
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_latency * 1000,
+            "max_flush_ms": self.max_latency * 1000,
+        }
+
+
+class Storage(ABC):
+    """Base class for ziBot's persistent data.
+
+    Guild config and custom commands are handed out as plain dicts that the
+    bot mutates in place, callers then tell the storage which guild changed.
+    Sharded processes pass their `shard_ids` to only load their own guilds.
+    """
+
+    @abstractmethod
+    def load_config(self, shard_ids=None, shard_count=1):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_guild(self, guild_id, config):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_guild(self, guild_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_custom_commands(self, shard_ids=None, shard_count=1):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_custom_command(self, guild_id, name, message):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_custom_command(self, guild_id, name):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_watchlists(self, shard_ids=None, shard_count=1):
+        """Return {guild_id: [media_id]} of every guild's anime watchlist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_watchlist(self, guild_id, media_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_watchlist(self, guild_id, media_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_media_cache(self):
+        """Return {media_id: (expires, data)} of cached AniList media."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_media(self, media_id, data, expires):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_media(self, media_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_titles(self):
+        """Return {media_id: (format, titles)} of the anime title index."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_titles(self, media_id, format, titles):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_mal_ids(self):
+        """Return {mal_id: anilist_id}."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_mal_ids(self, pairs):
+        """Store [(mal_id, anilist_id)]."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_timers(self, name):
+        """Return {key: (due, payload)} of the `name` scheduler's timers."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_timer(self, name, key, due, payload):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_timer(self, name, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_speedrun_meta(self):
+        """Return {resource: (etag, last modified, data)} of speedrun.com
+        metadata."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_speedrun_meta(self, resource, etag, modified, data):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_pending_posts(self):
+        """Return {run_id: message_id} of posted pending speedrun.com runs."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_pending_post(self, run_id, message_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_pending_posts(self, run_ids):
+        raise NotImplementedError
+
+    async def flush(self):
+        """Write everything that's still pending, called on shutdown."""
+        pass
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class JSONStorage(Storage):
+    """The original `data/*.json` files, fine for small installs.
+
+    Writes are coalesced by `WriteBehind`, so a burst of admin commands only
+    costs one write per file."""
+
+    def __init__(self, path="data", flush_interval=0.5):
+        self.path = path
+        self.writer = WriteBehind(self._serialize, flush_interval)
+        self.config = self._load("guild.json", {})
+        self.custom_commands = self._load("custom_commands.json", {})
+        anime = self._load("anime.json", {"guilds": {}})
+        self.watchlists = anime.get("guilds", {})
+        if "watchlist" in anime:
+            self._migrate_watchlist(anime["watchlist"])
+        self.media = {
+            int(k): (v["expires"], v["data"])
+            for k, v in self._load("anime_cache.json", {}).items()
+        }
+        self.timers = self._load("timers.json", {})
+        self.titles = {
+            int(k): tuple(v) for k, v in self._load("anime_titles.json", {}).items()
+        }
+        self.mal_ids = {
+            int(k): v for k, v in self._load("anime_mal.json", {}).items()
+        }
+        self.speedrun = self._load("speedrun_meta.json", {})
+        self.pending_posts = self._load("pending_runs.json", {})
+
+    def _load(self, name, default):
+        try:
+            with open(os.path.join(self.path, name), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            atomic_write(os.path.join(self.path, name), json.dumps(default, indent=4))
+            return default
+
+    def _migrate_watchlist(self, watchlist):
+        """Move the old global watchlist to the main server."""
+        if watchlist:
+            self.watchlists[LEGACY_ANIME_GUILD] = watchlist
+            config = self.config.get(LEGACY_ANIME_GUILD)
+            if config is not None and "anime_ch" not in config:
+                config["anime_ch"] = LEGACY_ANIME_CHANNEL
+                self._mark_dirty("guild.json", LEGACY_ANIME_GUILD)
+        self._mark_dirty("anime.json")
+
+    def _serialize(self, path):
+        # Only copy here, the worker thread does the dumping. Config, commands
+        # and watchlists get mutated in place so they're copied all the way
+        # down, the rest only ever has its values replaced
+        name = os.path.basename(path)
+        if name == "guild.json":
+            return functools.partial(dump_pretty, snapshot(self.config))
+        elif name == "custom_commands.json":
+            return functools.partial(dump_pretty, snapshot(self.custom_commands))
+        elif name == "anime_cache.json":
+            return functools.partial(dump_media, dict(self.media))
+        elif name == "timers.json":
+            timers = {k: dict(v) for k, v in self.timers.items()}
+            return functools.partial(dump_pretty, timers)
+        elif name == "speedrun_meta.json":
+            return functools.partial(dump_compact, dict(self.speedrun))
+        elif name == "pending_runs.json":
+            return functools.partial(dump_pretty, dict(self.pending_posts))
+        elif name == "anime_mal.json":
+            return functools.partial(dump_compact, dict(self.mal_ids))
+        elif name == "anime_titles.json":
+            return functools.partial(dump_compact, dict(self.titles))
+        return functools.partial(dump_pretty, {"guilds": snapshot(self.watchlists)})
+
+    def _mark_dirty(self, name, key=None):
+        self.writer.mark(os.path.join(self.path, name), key)
+
+    def load_config(self, shard_ids=None, shard_count=1):
+        if shard_ids is None:
+            return self.config
+        return {
+            k: v for k, v in self.config.items() if on_shards(k, shard_ids, shard_count)
+        }
+
+    def save_guild(self, guild_id, config):
+        self.config[str(guild_id)] = config
+        self._mark_dirty("guild.json", str(guild_id))
+
+    def delete_guild(self, guild_id):
+        self.config.pop(str(guild_id), None)
+        self._mark_dirty("guild.json", str(guild_id))
+
+    def load_custom_commands(self, shard_ids=None, shard_count=1):
+        if shard_ids is None:
+            return self.custom_commands
+        return {
+            k: v
+            for k, v in self.custom_commands.items()
+            if on_shards(k, shard_ids, shard_count)
+        }
+
+    def save_custom_command(self, guild_id, name, message):
+        self.custom_commands.setdefault(str(guild_id), {})[name] = message
+        self._mark_dirty("custom_commands.json", str(guild_id))
+
+    def delete_custom_command(self, guild_id, name):
+        self.custom_commands.get(str(guild_id), {}).pop(name, None)
+        self._mark_dirty("custom_commands.json", str(guild_id))
+
+    def load_watchlists(self, shard_ids=None, shard_count=1):
+        return {
+            k: list(v)
+            for k, v in self.watchlists.items()
+            if on_shards(k, shard_ids, shard_count)
+        }
+
+    def add_watchlist(self, guild_id, media_id):
+        watchlist = self.watchlists.setdefault(str(guild_id), [])
+        if media_id not in watchlist:
+            watchlist.append(media_id)
+        self._mark_dirty("anime.json", str(guild_id))
+
+    def remove_watchlist(self, guild_id, media_id):
+        watchlist = self.watchlists.get(str(guild_id), [])
+        if media_id in watchlist:
+            watchlist.remove(media_id)
+        if not watchlist:
+            self.watchlists.pop(str(guild_id), None)
+        self._mark_dirty("anime.json", str(guild_id))
+
+    def load_media_cache(self):
+        return dict(self.media)
+
+    def save_media(self, media_id, data, expires):
+        self.media[media_id] = (expires, data)
+        self._mark_dirty("anime_cache.json", media_id)
+
+    def delete_media(self, media_ids):
+        for media_id in media_ids:
+            self.media.pop(media_id, None)
+        self._mark_dirty("anime_cache.json")
+
+    def load_titles(self):
+        return dict(self.titles)
+
+    def save_titles(self, media_id, format, titles):
+        self.titles[media_id] = (format, titles)
+        self._mark_dirty("anime_titles.json", media_id)
+
+    def load_mal_ids(self):
+        return dict(self.mal_ids)
+
+    def save_mal_ids(self, pairs):
+        self.mal_ids.update(pairs)
+        self._mark_dirty("anime_mal.json")
+
+    def load_timers(self, name):
+        return {
+            key: (timer["due"], timer["payload"])
+            for key, timer in self.timers.get(name, {}).items()
+        }
+
+    def save_timer(self, name, key, due, payload):
+        self.timers.setdefault(name, {})[key] = {"due": due, "payload": payload}
+        self._mark_dirty("timers.json", name)
+
+    def delete_timer(self, name, key):
+        self.timers.get(name, {}).pop(key, None)
+        self._mark_dirty("timers.json", name)
+
+    def load_speedrun_meta(self):
+        return {
+            k: (v["etag"], v["modified"], v["data"]) for k, v in self.speedrun.items()
+        }
+
+    def save_speedrun_meta(self, resource, etag, modified, data):
+        self.speedrun[resource] = {"etag": etag, "modified": modified, "data": data}
+        self._mark_dirty("speedrun_meta.json", resource)
+
+    def load_pending_posts(self):
+        return dict(self.pending_posts)
+
+    def save_pending_post(self, run_id, message_id):
+        self.pending_posts[run_id] = message_id
+        self._mark_dirty("pending_runs.json", run_id)
+
+    def delete_pending_posts(self, run_ids):
+        for run_id in run_ids:
+            self.pending_posts.pop(run_id, None)
+        self._mark_dirty("pending_runs.json")
+
+    async def flush(self):
+        await self.writer.close()
+
+    def stats(self):
+        return self.writer.stats()
+
+    def close(self):
+        self.writer.flush_now()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guild_config (
+    guild_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (guild_id, key)
+);
+CREATE TABLE IF NOT EXISTS custom_commands (
+    guild_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS anime_subscriptions (
+    guild_id TEXT NOT NULL,
+    media_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, media_id)
+);
+CREATE TABLE IF NOT EXISTS anime_cache (
+    media_id INTEGER PRIMARY KEY,
+    expires REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS anime_titles (
+    media_id INTEGER PRIMARY KEY,
+    format TEXT,
+    titles TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS anime_mal (
+    mal_id INTEGER PRIMARY KEY,
+    media_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS timers (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    due REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+);
+CREATE TABLE IF NOT EXISTS speedrun_meta (
+    resource TEXT PRIMARY KEY,
+    etag TEXT,
+    modified TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_posts (
+    run_id TEXT PRIMARY KEY,
+    message_id INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteStorage(Storage):
+    """SQLite (WAL) storage, every write only touches the affected rows.
+
+    Writes made from the event loop run in order on one worker thread."""
+
+    def __init__(self, path="data/zibot.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+        # One writer thread keeps writes in order and off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.logger = logging.getLogger("discord")
+        self._pending_lock = threading.Lock()
+
+        # Monitoring
+        self.pending = 0
+        self.flushes = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    def _write(self, *statements):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (e.g. the importer), just write it now
+            self._execute(statements)
+            return
+        with self._pending_lock:
+            self.pending += 1
+        self.executor.submit(self._execute, statements)
+
+    def _execute(self, statements):
+        # Every call is one transaction, a list of params means executemany
+        start = time.perf_counter()
+        try:
+            with self.lock, self.db:
+                for sql, params in statements:
+                    if isinstance(params, list):
+                        self.db.executemany(sql, params)
+                    else:
+                        self.db.execute(sql, params)
+        except sqlite3.Error:
+            self.logger.exception("SQLite write failed:")
+        latency = time.perf_counter() - start
+        with self._pending_lock:
+            self.pending = max(self.pending - 1, 0)
+        self.flushes += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def _select(self, sql, shard_ids, shard_count):
+        # Let SQLite skip other shards' guilds instead of filtering in Python
+        if shard_ids is None:
+            return self.db.execute(sql)
+        return self.db.execute(
+            sql
+            + " WHERE (CAST(guild_id AS INTEGER) >> 22) % ? IN "
+            + f"({', '.join('?' * len(shard_ids))})",
+            (shard_count, *shard_ids),
+        )
+
+    def load_config(self, shard_ids=None, shard_count=1):
+        config = {}
+        with self.lock:
+            rows = self._select(
+                "SELECT guild_id, key, value FROM guild_config", shard_ids, shard_count
+            )
+            for guild_id, key, value in rows:
+                config.setdefault(guild_id, {})[key] = json.loads(value)
+        return config
+
+    def save_guild(self, guild_id, config):
+        guild_id = str(guild_id)
+        keys = list(config.keys())
+        self._write(
+            (
+                "DELETE FROM guild_config WHERE guild_id = ? AND key NOT IN "
+                + f"({', '.join('?' * len(keys))})",
+                (guild_id, *keys),
+            ),
+            (
+                "INSERT INTO guild_config (guild_id, key, value) VALUES (?, ?, ?) "
+                + "ON CONFLICT (guild_id, key) DO UPDATE SET value = excluded.value",
+                [(guild_id, k, json.dumps(v)) for k, v in config.items()],
+            ),
+        )
+
+    def delete_guild(self, guild_id):
+        self._write(("DELETE FROM guild_config WHERE guild_id = ?", (str(guild_id),)))
+
+    def load_custom_commands(self, shard_ids=None, shard_count=1):
+        commands = {}
+        with self.lock:
+            rows = self._select(
+                "SELECT guild_id, name, message FROM custom_commands",
+                shard_ids,
+                shard_count,
+            )
+            for guild_id, name, message in rows:
+                commands.setdefault(guild_id, {})[name] = message
+        return commands
+
+    def save_custom_command(self, guild_id, name, message):
+        self._write(
+            (
+                "INSERT INTO custom_commands (guild_id, name, message) VALUES (?, ?, ?) "
+                + "ON CONFLICT (guild_id, name) DO UPDATE SET message = excluded.message",
+                (str(guild_id), name, message),
+            )
+        )
+
+    def delete_custom_command(self, guild_id, name):
+        self._write(
+            (
+                "DELETE FROM custom_commands WHERE guild_id = ? AND name = ?",
+                (str(guild_id), name),
+            )
+        )
+
+    def load_watchlists(self, shard_ids=None, shard_count=1):
+        watchlists = {}
+        with self.lock:
+            rows = self._select(
+                "SELECT guild_id, media_id FROM anime_subscriptions",
+                shard_ids,
+                shard_count,
+            )
+            for guild_id, media_id in rows:
+                watchlists.setdefault(guild_id, []).append(media_id)
+        return watchlists
+
+    def add_watchlist(self, guild_id, media_id):
+        self._write(
+            (
+                "INSERT OR IGNORE INTO anime_subscriptions (guild_id, media_id) "
+                + "VALUES (?, ?)",
+                (str(guild_id), media_id),
+            )
+        )
+
+    def remove_watchlist(self, guild_id, media_id):
+        self._write(
+            (
+                "DELETE FROM anime_subscriptions WHERE guild_id = ? AND media_id = ?",
+                (str(guild_id), media_id),
+            )
+        )
+
+    def load_media_cache(self):
+        with self.lock:
+            rows = self.db.execute("SELECT media_id, expires, data FROM anime_cache")
+            return {
+                media_id: (expires, json.loads(data))
+                for media_id, expires, data in rows
+            }
+
+    def save_media(self, media_id, data, expires):
+        self._write(
+            (
+                "INSERT INTO anime_cache (media_id, expires, data) VALUES (?, ?, ?) "
+                + "ON CONFLICT (media_id) DO UPDATE "
+                + "SET expires = excluded.expires, data = excluded.data",
+                (media_id, expires, json.dumps(data)),
+            )
+        )
+
+    def delete_media(self, media_ids):
+        self._write(
+            (
+                "DELETE FROM anime_cache WHERE media_id = ?",
+                [(media_id,) for media_id in media_ids],
+            )
+        )
+
+    def load_titles(self):
+        with self.lock:
+            rows = self.db.execute("SELECT media_id, format, titles FROM anime_titles")
+            return {
+                media_id: (format, json.loads(titles))
+                for media_id, format, titles in rows
+            }
+
+    def save_titles(self, media_id, format, titles):
+        self._write(
+            (
+                "INSERT INTO anime_titles (media_id, format, titles) VALUES (?, ?, ?) "
+                + "ON CONFLICT (media_id) DO UPDATE "
+                + "SET format = excluded.format, titles = excluded.titles",
+                (media_id, format, json.dumps(titles, ensure_ascii=False)),
+            )
+        )
+
+    def load_mal_ids(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT mal_id, media_id FROM anime_mal"))
+
+    def save_mal_ids(self, pairs):
+        self._write(
+            (
+                "INSERT INTO anime_mal (mal_id, media_id) VALUES (?, ?) "
+                + "ON CONFLICT (mal_id) DO UPDATE SET media_id = excluded.media_id",
+                list(pairs),
+            )
+        )
+
+    def load_timers(self, name):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT key, due, payload FROM timers WHERE name = ?", (name,)
+            )
+            return {key: (due, json.loads(payload)) for key, due, payload in rows}
+
+    def save_timer(self, name, key, due, payload):
+        self._write(
+            (
+                "INSERT INTO timers (name, key, due, payload) VALUES (?, ?, ?, ?) "
+                + "ON CONFLICT (name, key) DO UPDATE "
+                + "SET due = excluded.due, payload = excluded.payload",
+                (name, key, due, json.dumps(payload)),
+            )
+        )
+
+    def delete_timer(self, name, key):
+        self._write(("DELETE FROM timers WHERE name = ? AND key = ?", (name, key)))
+
+    def load_speedrun_meta(self):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT resource, etag, modified, data FROM speedrun_meta"
+            )
+            return {
+                resource: (etag, modified, json.loads(data))
+                for resource, etag, modified, data in rows
+            }
+
+    def save_speedrun_meta(self, resource, etag, modified, data):
+        self._write(
+            (
+                "INSERT INTO speedrun_meta (resource, etag, modified, data) "
+                + "VALUES (?, ?, ?, ?) ON CONFLICT (resource) DO UPDATE "
+                + "SET etag = excluded.etag, modified = excluded.modified, "
+                + "data = excluded.data",
+                (resource, etag, modified, json.dumps(data)),
+            )
+        )
+
+    def load_pending_posts(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT run_id, message_id FROM pending_posts"))
+
+    def save_pending_post(self, run_id, message_id):
+        self._write(
+            (
+                "INSERT INTO pending_posts (run_id, message_id) VALUES (?, ?) "
+                + "ON CONFLICT (run_id) DO UPDATE SET message_id = excluded.message_id",
+                (run_id, message_id),
+            )
+        )
+
+    def delete_pending_posts(self, run_ids):
+        self._write(
+            (
+                "DELETE FROM pending_posts WHERE run_id = ?",
+                [(run_id,) for run_id in run_ids],
+            )
+        )
+
+    async def flush(self):
+        # Queued behind every write that's still pending
+        await asyncio.get_running_loop().run_in_executor(self.executor, lambda: None)
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_latency * 1000,
+            "max_flush_ms": self.max_latency * 1000,
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            self.db.close()
+
+
+def get_storage(backend=None, path="data"):
+    """Get storage backend by name, defaults to env variable `STORAGE`."""
+    backend = (backend or os.getenv("STORAGE") or "json").lower()
+    if backend == "sqlite":
+        return SQLiteStorage(os.path.join(path, "zibot.db"))
+    return JSONStorage(path)
+
+
+def import_json(storage, path="data"):
+    """Copy everything from the JSON files into `storage`."""
+    source = JSONStorage(path)
+    for guild_id, config in source.load_config().items():
+        storage.save_guild(guild_id, config)
+    for guild_id, commands in source.load_custom_commands().items():
+        for name, message in commands.items():
+            storage.save_custom_command(guild_id, name, message)
+    for guild_id, watchlist in source.load_watchlists().items():
+        for media_id in watchlist:
+            storage.add_watchlist(guild_id, media_id)
+    for media_id, (expires, data) in source.load_media_cache().items():
+        storage.save_media(media_id, data, expires)
+    for media_id, (format, titles) in source.load_titles().items():
+        storage.save_titles(media_id, format, titles)
+    storage.save_mal_ids(source.load_mal_ids().items())
+    for name in source.timers:
+        for key, (due, payload) in source.load_timers(name).items():
+            storage.save_timer(name, key, due, payload)
+    for resource, entry in source.load_speedrun_meta().items():
+        storage.save_speedrun_meta(resource, *entry)
+    for run_id, message_id in source.load_pending_posts().items():
+        storage.save_pending_post(run_id, message_id)
+    return source
+
+
+if __name__ == "__main__":
+    # python3 -m utilities.storage, one-shot import of data/*.json into SQLite
+    storage = SQLiteStorage()
+    source = import_json(storage)
+    print(
+        f"Imported {len(source.config)} guilds, "
+        + f"{sum(len(c) for c in source.custom_commands.values())} custom commands, "
+        + f"{sum(len(w) for w in source.watchlists.values())} watched anime, "
+        + f"{sum(len(t) for t in source.timers.values())} timers, "
+        + f"{len(source.media)} cached anime, {len(source.titles)} titles, "
+        + f"{len(source.mal_ids)} MyAnimeList ids, "
+        + f"{len(source.speedrun)} speedrun.com resources and "
+        + f"{len(source.pending_posts)} posted pending runs into {storage.path}"
+    )
+    storage.close()
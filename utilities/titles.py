@@ -0,0 +1,103 @@
+import re
+
+from collections import Counter
+
+
+def normalize(title):
+    """Lowercase and collapse everything that isn't a letter or digit."""
+    return " ".join(re.sub(r"[\W_]+", " ", title.lower()).split())
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Fuzzy title -> AniList id lookup without asking AniList.
+
+    Romaji, English and synonym titles of every media we come across are
+    indexed by trigram and persisted through the bot's storage. `match()`
+    only answers when it's confident, callers fall back to the API
+    otherwise."""
+
+    def __init__(self, storage, threshold=0.8, margin=0.15):
+        self.storage = storage
+        self.threshold = threshold
+        self.margin = margin
+        # media_id: (format, titles)
+        self.titles = {}
+        # media_id: [(normalized title, its trigrams)]
+        self.entries = {}
+        # trigram: {(media_id, normalized title)}
+        self.postings = {}
+        # (media_id, normalized title): amount of trigrams
+        self.lengths = {}
+        self.hits = 0
+        self.misses = 0
+        for media_id, (format, titles) in storage.load_titles().items():
+            self._index(media_id, format, titles)
+
+    def _unindex(self, media_id):
+        for title, grams in self.entries.pop(media_id, ()):
+            del self.lengths[(media_id, title)]
+            for gram in grams:
+                entries = self.postings[gram]
+                entries.discard((media_id, title))
+                if not entries:
+                    del self.postings[gram]
+
+    def _index(self, media_id, format, titles):
+        self._unindex(media_id)
+        self.titles[media_id] = (format, titles)
+        entries = self.entries[media_id] = []
+        for title in {normalize(t) for t in titles} - {""}:
+            grams = trigrams(title)
+            entries.append((title, grams))
+            self.lengths[(media_id, title)] = len(grams)
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add((media_id, title))
+
+    def add(self, media):
+        """Index (or re-index) the titles of a Media object."""
+        titles = [
+            media["title"].get("romaji"),
+            media["title"].get("english"),
+            *(media.get("synonyms") or []),
+        ]
+        titles = [t for t in dict.fromkeys(titles) if t]
+        format = media.get("format")
+        if not titles or self.titles.get(media["id"]) == (format, titles):
+            return
+        self._index(media["id"], format, titles)
+        self.storage.save_titles(media["id"], format, titles)
+
+    def scores(self, name, format=None):
+        """Best Jaccard similarity of `name` per media id, best first."""
+        query = trigrams(normalize(name))
+        shared = Counter()
+        for gram in query:
+            shared.update(self.postings.get(gram, ()))
+
+        best = {}
+        for entry, count in shared.items():
+            media_id = entry[0]
+            if format and self.titles[media_id][0] != format.upper():
+                continue
+            score = count / (len(query) + self.lengths[entry] - count)
+            if score > best.get(media_id, 0):
+                best[media_id] = score
+        return sorted(best.items(), key=lambda i: i[1], reverse=True)
+
+    def match(self, name, format=None):
+        """Return the id `name` refers to, or None when unsure."""
+        if not normalize(name):
+            return None
+        scores = self.scores(name, format)
+        if scores and scores[0][1] >= self.threshold:
+            # Two different shows both match well, let AniList decide
+            if len(scores) == 1 or scores[1][1] < scores[0][1] - self.margin:
+                self.hits += 1
+                return scores[0][0]
+        self.misses += 1
+        return None
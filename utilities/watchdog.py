@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from collections import deque
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StallWatchdog:
+    """Catch callbacks that block the event loop and find out who did it.
+
+    A task on the loop keeps bumping a heartbeat, a monitor thread notices
+    when it stops moving for longer than `threshold` seconds and grabs the
+    loop thread's stack while it's still stuck. The stall is logged and
+    attributed to the running command (or the innermost frame of our own
+    code) once the loop is back."""
+
+    def __init__(self, bot, threshold=0.25, history=500):
+        self.bot = bot
+        self.logger = logging.getLogger("discord")
+        self.threshold = threshold
+        self.interval = threshold / 5
+        # (time, offender, seconds) of the most recent stalls
+        self.stalls = deque(maxlen=history)
+        # Last captured stack of every offender
+        self.stacks = {}
+        self.total = 0
+        self._commands = {}
+        self._beat = time.monotonic()
+        self._seen = None
+        self._captured = None
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def _map_commands(self):
+        self._commands = {
+            command.callback.__code__: command
+            for command in self.bot.walk_commands()
+        }
+
+    def _attribute(self, frame):
+        """Return (offender, stack) of the loop thread's current `frame`."""
+        stack = traceback.extract_stack(frame)
+        command = location = None
+        while frame is not None and command is None:
+            command = self._commands.get(frame.f_code)
+            path = frame.f_code.co_filename
+            if (
+                location is None
+                and path.startswith(ROOT)
+                and "site-packages" not in path
+            ):
+                location = (
+                    f"{os.path.relpath(path, ROOT)}:{frame.f_lineno}"
+                    + f" in {frame.f_code.co_name}"
+                )
+            frame = frame.f_back
+        if command is not None:
+            offender = f"{command.cog_name or 'Bot'}.{command.qualified_name}"
+        else:
+            last = stack[-1]
+            offender = location or f"{last.filename}:{last.lineno} in {last.name}"
+        return offender, (location, "".join(stack.format()))
+
+    def _monitor(self):
+        while not self._stopping.wait(self.interval):
+            beat = self._beat
+            if beat == self._seen or time.monotonic() - beat < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            captured = self._attribute(frame)
+            # The loop might have moved on while we were looking
+            if self._beat == beat:
+                self._seen = beat
+                self._captured = captured
+
+    def _record(self, captured, seconds):
+        offender, (location, stack) = captured
+        self.total += 1
+        self.stalls.append((time.time(), offender, seconds))
+        self.stacks[offender] = stack
+        self.logger.warning(
+            f"Event loop blocked for {seconds:.2f}s by {offender}"
+            + (f" ({location})" if location and location not in offender else "")
+            + f"\n{stack}"
+        )
+        # Extensions might have been reloaded since
+        self._map_commands()
+
+    async def _tick(self):
+        self._loop_thread = threading.get_ident()
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            captured, self._captured = self._captured, None
+            if captured is not None:
+                self._record(
+                    captured, time.monotonic() - self._beat - self.interval
+                )
+
+    def top(self, n=10):
+        """Worst offenders of the recent stalls by total blocked time."""
+        offenders = {}
+        for _, offender, seconds in self.stalls:
+            count, total, worst = offenders.get(offender, (0, 0.0, 0.0))
+            offenders[offender] = (count + 1, total + seconds, max(worst, seconds))
+        return sorted(offenders.items(), key=lambda i: i[1][1], reverse=True)[:n]
+
+    def start(self):
+        self._map_commands()
+        self._task = self.bot.loop.create_task(self._tick())
+        self._thread = threading.Thread(
+            target=self._monitor, name="stall-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,102 @@
+import asyncio
+import discord
+import logging
+
+# Most embeds one message can carry
+EMBEDS_PER_MESSAGE = 10
+
+
+class BulkPoster:
+    """Posts lots of embeds through per-channel webhooks, 10 per message.
+
+    One webhook called `name` is reused (or created) for every channel.
+    Posts to a channel are sent one at a time so they keep their order,
+    discord.py waits out each webhook's rate limit bucket. Channels where we
+    can't manage webhooks fall back to one message per embed."""
+
+    def __init__(self, bot, name="ziBot"):
+        self.logger = logging.getLogger("discord")
+        self.bot = bot
+        self.name = name
+        # channel id: Webhook, None if we're not allowed to use one there
+        self.webhooks = {}
+        self.locks = {}
+        self.messages = 0
+        self.embeds = 0
+        self.fallbacks = 0
+
+    async def webhook(self, channel):
+        try:
+            return self.webhooks[channel.id]
+        except KeyError:
+            pass
+        webhook = None
+        try:
+            for hook in await channel.webhooks():
+                # Only webhooks we created come with a token
+                if hook.name == self.name and hook.token:
+                    webhook = hook
+                    break
+            else:
+                webhook = await channel.create_webhook(name=self.name)
+        except discord.Forbidden:
+            self.logger.warning(
+                f"Can't manage webhooks in #{channel} ({channel.id}),"
+                + " posting one embed per message"
+            )
+        self.webhooks[channel.id] = webhook
+        return webhook
+
+    async def _send(self, channel, embeds):
+        """Send up to 10 embeds, returns the message id of each."""
+        webhook = await self.webhook(channel)
+        if webhook is not None:
+            try:
+                message = await webhook.send(
+                    embeds=embeds,
+                    wait=True,
+                    username=self.bot.user.name,
+                    avatar_url=str(self.bot.user.avatar_url),
+                )
+            except discord.NotFound:
+                # Somebody deleted it, get a new one next time
+                self.webhooks.pop(channel.id, None)
+            else:
+                self.messages += 1
+                self.embeds += len(embeds)
+                return [message.id] * len(embeds)
+        ids = []
+        for embed in embeds:
+            ids.append((await channel.send(embed=embed)).id)
+        self.messages += len(embeds)
+        self.embeds += len(embeds)
+        self.fallbacks += len(embeds)
+        return ids
+
+    async def post(self, channel, embeds, progress=None):
+        """Post `embeds` in order, returns the message id of every embed.
+
+        `progress(done, total)` is awaited after every message."""
+        embeds = list(embeds)
+        ids = []
+        lock = self.locks.setdefault(channel.id, asyncio.Lock())
+        async with lock:
+            for i in range(0, len(embeds), EMBEDS_PER_MESSAGE):
+                ids += await self._send(channel, embeds[i : i + EMBEDS_PER_MESSAGE])
+                if progress is not None:
+                    await progress(len(ids), len(embeds))
+        return ids
+
+    async def edit(self, channel, message_id, embeds):
+        """Replace the embeds of a message `post` sent, returns whether it
+        could."""
+        webhook = await self.webhook(channel)
+        if webhook is None:
+            return False
+        try:
+            # Added in discord.py 1.6, like TextChannel.get_partial_message
+            await webhook.edit_message(message_id, embeds=embeds)
+        except discord.HTTPException:
+            # Sent before the webhook got replaced, or without one
+            return False
+        return True
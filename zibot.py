@@ -2,8 +2,10 @@ import asyncio
 import discord
 import json
 import logging
+import os
+import sys
 
-from bot import ziBot, get_prefix, shard, shard_count, token
+from bot import ziBot, get_prefix, cluster_id, shard, shard_count, shard_ids, token
 
 
 def setup_logging():
@@ -13,6 +15,16 @@ def setup_logging():
     logger = logging.getLogger("discord")
     logger.setLevel(logging.INFO)
 
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(fmt=FORMAT, datefmt=DATE_FORMAT))
+    console_handler.setLevel(logging.WARNING)
+    logger.addHandler(console_handler)
+
+    if cluster_id is not None:
+        # Running under the launcher, it collects our output into its own log
+        console_handler.setLevel(logging.INFO)
+        return
+
     file_handler = logging.FileHandler(
         filename="discord.log", mode="a", encoding="utf-8"
     )
@@ -20,11 +32,6 @@ def setup_logging():
     file_handler.setLevel(logging.INFO)
     logger.addHandler(file_handler)
 
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(fmt=FORMAT, datefmt=DATE_FORMAT))
-    console_handler.setLevel(logging.WARNING)
-    logger.addHandler(console_handler)
-
 
 def init_bot():
     logger = logging.getLogger("discord")
@@ -33,18 +40,45 @@ def init_bot():
         logger.error('No token found, please add environment variable "TOKEN"!')
         return
 
+    if shard_ids:
+        shards = [int(i) for i in shard_ids.split(",")]
+    else:
+        shards = [int(shard)]
+
     bot = ziBot(
         command_prefix=get_prefix,
         case_insensitive=True,
         allowed_mentions=discord.AllowedMentions(
             everyone=False, users=True, roles=False
         ),
-        shard_id=int(shard),
+        shard_ids=shards,
         shard_count=int(shard_count),
     )
     bot.run()
 
 
+def init_launcher():
+    """Run every shard from one box, see utilities/launcher.py."""
+    from utilities.launcher import Launcher
+
+    logger = logging.getLogger("discord")
+
+    total = int(shard_count)
+    clusters = int(os.getenv("CLUSTERS") or min(total, os.cpu_count() or 1))
+    if clusters > 1 and (os.getenv("STORAGE") or "json").lower() != "sqlite":
+        logger.error(
+            "Running more than one cluster needs STORAGE=sqlite, "
+            + "the JSON files can't be shared between processes!"
+        )
+        return
+
+    logger.warning(f"Launching {total} shards in {clusters} clusters")
+    asyncio.run(Launcher(total, clusters).start())
+
+
 if __name__ == "__main__":
     setup_logging()
-    init_bot()
+    if sys.argv[1:2] == ["launch"]:
+        init_launcher()
+    else:
+        init_bot()